@@ -12,13 +12,19 @@ class R2Config:
     SECRET_ACCESS_KEY = os.getenv("R2_SECRET_ACCESS_KEY")
     BUCKET_NAME = os.getenv("R2_BUCKET_NAME", "manga-storage")
 
-    # R2 endpoint
-    ENDPOINT_URL = f"https://{ACCOUNT_ID}.r2.cloudflarestorage.com"
+    # R2 endpoint; R2_ENDPOINT_URL trỏ sang server tương thích S3 khác
+    # (vd. MinIO chạy local) để test
+    CUSTOM_ENDPOINT_URL = os.getenv("R2_ENDPOINT_URL")
+    ENDPOINT_URL = (
+        CUSTOM_ENDPOINT_URL or f"https://{ACCOUNT_ID}.r2.cloudflarestorage.com"
+    )
     PUBLIC_URL = os.getenv("R2_PUBLIC_URL")
 
     @classmethod
     def validate(cls):
-        required = ["ACCOUNT_ID", "ACCESS_KEY_ID", "SECRET_ACCESS_KEY"]
+        required = ["ACCESS_KEY_ID", "SECRET_ACCESS_KEY"]
+        if not cls.CUSTOM_ENDPOINT_URL:
+            required.insert(0, "ACCOUNT_ID")
         missing = [key for key in required if not getattr(cls, key)]
 
         if missing:
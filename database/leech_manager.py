@@ -1,6 +1,15 @@
+import asyncio
+import json
 from prisma import Prisma
-from prisma.models import MangaSource, MangaSeries, MangaChapter, ChapterImage
-from typing import List, Optional, Dict, Any
+from prisma.errors import RecordNotFoundError
+from prisma.models import (
+    MangaSource,
+    MangaSeries,
+    MangaChapter,
+    ChapterImage,
+    ImageBlob,
+)
+from typing import Any, Dict, Iterable, List, Optional, Tuple
 from datetime import datetime, timedelta, timezone
 import logging
 
@@ -18,14 +27,25 @@ class PrismaClientSingleton:
 
 
 class LeecheDatabaseManager:
+    # Write-behind cho trạng thái chapter: flush khi đủ số lượng hoặc hết thời gian
+    STATUS_FLUSH_MAX_ITEMS = 50
+    STATUS_FLUSH_INTERVAL = 2.0
+    # Một cập nhật lỗi quá số lần này thì bỏ, không giữ lại mãi
+    STATUS_FLUSH_MAX_ATTEMPTS = 10
+
     def __init__(self) -> None:
         self.db = PrismaClientSingleton.get_client()
         self.logger: logging.Logger = logging.getLogger(__name__)
+        self._pending_status: Dict[int, Dict[str, Any]] = {}
+        self._flush_attempts: Dict[int, int] = {}
+        self._flush_lock = asyncio.Lock()
+        self._flush_task: Optional[asyncio.Task] = None
 
     async def connect(self) -> bool:
         """Kết nối database"""
         try:
             await self.db.connect()
+            self._flush_task = asyncio.create_task(self._flush_loop())
             self.logger.info("✅ Đã kết nối database")
             return True
         except Exception as e:
@@ -35,11 +55,76 @@ class LeecheDatabaseManager:
     async def disconnect(self) -> None:
         """Ngắt kết nối database"""
         try:
+            if self._flush_task:
+                # Chờ lượt flush đang chạy (nếu có) xong rồi mới dừng vòng lặp
+                async with self._flush_lock:
+                    self._flush_task.cancel()
+                try:
+                    await self._flush_task
+                except asyncio.CancelledError:
+                    pass
+                self._flush_task = None
+            await self.flush()
             await self.db.disconnect()
             self.logger.info("✅ Đã ngắt kết nối database")
         except Exception as e:
             self.logger.error(f"❌ Lỗi khi ngắt kết nối: {e}")
 
+    # ==================== WRITE-BEHIND BUFFER ====================
+
+    async def _flush_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.STATUS_FLUSH_INTERVAL)
+            await self.flush()
+
+    async def flush(self) -> int:
+        """Ghi các cập nhật trạng thái chapter đang chờ trong một transaction"""
+        async with self._flush_lock:
+            pending, self._pending_status = self._pending_status, {}
+            if not pending:
+                return 0
+
+            try:
+                async with self.db.batch_() as batcher:
+                    for chapter_id, update_data in pending.items():
+                        batcher.mangachapter.update(
+                            where={"id": chapter_id}, data=update_data
+                        )
+                self.logger.debug(f"✅ Đã flush {len(pending)} trạng thái chapter")
+                for chapter_id in pending:
+                    self._flush_attempts.pop(chapter_id, None)
+                return len(pending)
+            except Exception as e:
+                # Cả transaction hỏng vì một dòng lỗi: ghi lại từng dòng một
+                self.logger.warning(f"⚠️ Lỗi flush theo batch, ghi từng chapter: {e}")
+                return await self._flush_each(pending)
+
+    async def _flush_each(self, pending: Dict[int, Dict[str, Any]]) -> int:
+        flushed = 0
+        for chapter_id, update_data in pending.items():
+            try:
+                await self.db.mangachapter.update(
+                    where={"id": chapter_id}, data=update_data
+                )
+                flushed += 1
+                self._flush_attempts.pop(chapter_id, None)
+            except RecordNotFoundError:
+                # Chapter đã bị xóa từ lúc xếp hàng
+                self._flush_attempts.pop(chapter_id, None)
+            except Exception as e:
+                attempts = self._flush_attempts.get(chapter_id, 0) + 1
+                if attempts >= self.STATUS_FLUSH_MAX_ATTEMPTS:
+                    self.logger.error(
+                        f"❌ Bỏ cập nhật trạng thái chapter {chapter_id} "
+                        f"sau {attempts} lần lỗi: {e}"
+                    )
+                    self._flush_attempts.pop(chapter_id, None)
+                    continue
+                self._flush_attempts[chapter_id] = attempts
+                # Giữ lại để lần flush sau thử tiếp, trừ khi đã có bản mới hơn
+                self._pending_status.setdefault(chapter_id, update_data)
+        return flushed
+
     # ==================== MANGA SOURCE METHODS ====================
 
     async def get_manga_source(self, name: str) -> Optional[MangaSource]:
@@ -75,6 +160,24 @@ class LeecheDatabaseManager:
             self.logger.error(f"❌ Lỗi thêm manga source {name}: {e}")
             return None
 
+    async def get_active_sources(self) -> List[MangaSource]:
+        try:
+            return await self.db.mangasource.find_many(where={"status": "ACTIVE"})
+        except Exception as e:
+            self.logger.error(f"❌ Lỗi lấy manga sources: {e}")
+            return []
+
+    async def set_feed_checked(self, source_id: int, checked_at: datetime) -> None:
+        """Ghi nhận feed cập nhật của source đã được quét hết tới checked_at"""
+        try:
+            await self.db.mangasource.update(
+                where={"id": source_id}, data={"feed_checked_at": checked_at}
+            )
+        except Exception as e:
+            self.logger.error(
+                f"❌ Lỗi cập nhật feed_checked_at source {source_id}: {e}"
+            )
+
     # ==================== MANGA SERIES METHODS ====================
 
     async def add_manga_series(
@@ -155,19 +258,239 @@ class LeecheDatabaseManager:
             self.logger.error(f"Lỗi lấy pending series: {e}")
             return []
 
-    async def reset_stuck_downloads(self):
-        """Reset các chapter bị kẹt ở trạng thái DOWNLOADING"""
+    async def get_active_series(self) -> List[MangaSeries]:
+        """Lấy toàn bộ series ACTIVE, không xét last_update"""
+        try:
+            return await self.db.mangaseries.find_many(where={"status": "ACTIVE"})
+        except Exception as e:
+            self.logger.error(f"Lỗi lấy active series: {e}")
+            return []
+
+    async def mark_series_updated(
+        self, source_id: int, updates: Dict[str, datetime]
+    ) -> Optional[int]:
+        """Đánh dấu các series feed báo có cập nhật, theo path của target_url.
+
+        So theo path (bỏ scheme và domain) vì source hay đổi domain; một
+        query cho cả feed. Trả về số series được đánh dấu, None nếu lỗi.
+        """
+        if not updates:
+            return 0
+
+        payload = json.dumps(
+            [
+                {
+                    "path": path.rstrip("/"),
+                    "updated_at": updated_at.astimezone(timezone.utc)
+                    .replace(tzinfo=None)
+                    .isoformat(),
+                }
+                for path, updated_at in updates.items()
+            ]
+        )
+        try:
+            return await self.db.execute_raw(
+                "UPDATE manga_series AS ms "
+                "SET source_updated_at = u.updated_at "
+                "FROM jsonb_to_recordset($2::jsonb) AS u(path text, updated_at timestamp) "
+                "WHERE ms.source_id = $1 AND ms.status = 'ACTIVE' "
+                "AND rtrim(regexp_replace(ms.target_url, '^[a-z]+://[^/]+', ''), '/') "
+                "= u.path "
+                "AND (ms.source_updated_at IS NULL "
+                "OR ms.source_updated_at < u.updated_at)",
+                source_id,
+                payload,
+            )
+        except Exception as e:
+            self.logger.error(
+                f"❌ Lỗi đánh dấu series cập nhật source {source_id}: {e}"
+            )
+            return None
+
+    async def claim_series(
+        self,
+        owner: str,
+        lease_seconds: int,
+        limit: int = 1,
+        shard: Tuple[int, int] = (0, 1),
+        feed_recheck_days: int = 7,
+        exclude_ids: Iterable[int] = (),
+    ) -> List[MangaSeries]:
+        """Claim series cần xử lý và giữ lease trong lease_seconds.
+
+        FOR UPDATE SKIP LOCKED để các node chạy cùng lúc không claim trùng
+        series và không phải chờ nhau; series còn lease chưa hết hạn bị bỏ qua.
+        shard = (index, count) chỉ lấy các series có id % count == index.
+
+        Series (ACTIVE hoặc COMPLETED) cần xử lý khi:
+        - chưa tải lần nào,
+        - feed của source báo có cập nhật sau lần kiểm tra cuối,
+        - tới next_check_at (chưa có thì 1 ngày sau last_update); bỏ qua
+          với series ACTIVE của source có feed vừa được quét,
+        - series ACTIVE chưa kiểm tra trong feed_recheck_days ngày, phòng
+          khi feed bỏ sót.
+        Series quá hạn lâu nhất được claim trước; exclude_ids (vd. các series
+        lượt chạy hiện tại đã xử lý) không bao giờ được claim.
+        """
+        shard_index, shard_count = shard
         try:
-            stuck_chapters = await self.db.mangachapter.find_many(
-                where={"download_status": "DOWNLOADING"}
+            rows = await self.db.query_raw(
+                "UPDATE manga_series "
+                "SET lease_owner = $1, "
+                "lease_expires_at = (NOW() AT TIME ZONE 'UTC') "
+                "+ $2::int * INTERVAL '1 second' "
+                "WHERE id IN ("
+                "  SELECT ms.id FROM manga_series AS ms"
+                "  JOIN manga_sources AS src ON src.id = ms.source_id"
+                "  WHERE ms.status IN ('ACTIVE', 'COMPLETED')"
+                "  AND ((ms.status = 'ACTIVE' AND ms.last_update IS NULL)"
+                "    OR ms.source_updated_at"
+                "      > COALESCE(ms.last_checked_at, ms.last_update)"
+                "    OR (COALESCE(ms.next_check_at, ms.last_update + INTERVAL '1 day')"
+                "        <= (NOW() AT TIME ZONE 'UTC')"
+                "      AND (ms.status = 'COMPLETED'"
+                "        OR src.feed_checked_at IS NULL"
+                "        OR src.feed_checked_at"
+                "          < (NOW() AT TIME ZONE 'UTC') - INTERVAL '1 day'))"
+                "    OR (ms.status = 'ACTIVE'"
+                "      AND COALESCE(ms.last_checked_at, ms.last_update)"
+                "        < (NOW() AT TIME ZONE 'UTC') - $6::int * INTERVAL '1 day'))"
+                "  AND (ms.lease_expires_at IS NULL"
+                "    OR ms.lease_expires_at < (NOW() AT TIME ZONE 'UTC'))"
+                "  AND ms.id % $4 = $5"
+                "  AND NOT $7::jsonb @> to_jsonb(ms.id)"
+                "  ORDER BY COALESCE(ms.next_check_at, ms.last_update) ASC NULLS FIRST"
+                "  LIMIT $3"
+                "  FOR UPDATE OF ms SKIP LOCKED"
+                ") RETURNING id",
+                owner,
+                lease_seconds,
+                limit,
+                shard_count,
+                shard_index,
+                feed_recheck_days,
+                json.dumps(list(exclude_ids)),
             )
+            if not rows:
+                return []
 
-            reset_count = 0
-            for chapter in stuck_chapters:
-                await self.db.mangachapter.update(
-                    where={"id": chapter.id}, data={"download_status": "PENDING"}
-                )
-                reset_count += 1
+            return await self.db.mangaseries.find_many(
+                where={"id": {"in": [row["id"] for row in rows]}},
+                include={"source": True},
+            )
+        except Exception as e:
+            self.logger.error(f"❌ Lỗi claim series: {e}")
+            return []
+
+    async def get_check_schedule(
+        self, horizon_seconds: int, shard: Tuple[int, int] = (0, 1)
+    ) -> List[Tuple[int, datetime]]:
+        """(series_id, hạn kiểm tra) của các series tới hạn trong horizon_seconds.
+
+        Hạn không sớm hơn lúc lease/cooldown hiện tại hết hạn.
+        """
+        shard_index, shard_count = shard
+        try:
+            rows = await self.db.query_raw(
+                "SELECT id, EXTRACT(EPOCH FROM GREATEST("
+                "  COALESCE(next_check_at, last_update + INTERVAL '1 day'),"
+                "  lease_expires_at))::float AS due_at "
+                "FROM manga_series "
+                "WHERE status IN ('ACTIVE', 'COMPLETED')"
+                "  AND COALESCE(next_check_at, last_update + INTERVAL '1 day')"
+                "    <= (NOW() AT TIME ZONE 'UTC') + $1::int * INTERVAL '1 second'"
+                "  AND id % $2 = $3",
+                horizon_seconds,
+                shard_count,
+                shard_index,
+            )
+            return [
+                (row["id"], datetime.fromtimestamp(row["due_at"], timezone.utc))
+                for row in rows
+            ]
+        except Exception as e:
+            self.logger.error(f"❌ Lỗi lấy lịch kiểm tra series: {e}")
+            return []
+
+    async def get_release_times(self, series_id: int, limit: int) -> List[datetime]:
+        """Thời điểm phát hiện các chapter mới nhất của series, mới nhất trước"""
+        try:
+            chapters = await self.db.mangachapter.find_many(
+                where={"series_id": series_id},
+                order={"created_at": "desc"},
+                take=limit,
+            )
+            return [chapter.created_at for chapter in chapters]
+        except Exception as e:
+            self.logger.error(f"❌ Lỗi lấy lịch sử chapter series {series_id}: {e}")
+            return []
+
+    async def renew_series_leases(
+        self, series_ids: List[int], owner: str, lease_seconds: int
+    ) -> int:
+        """Heartbeat: gia hạn lease các series node này đang giữ"""
+        if not series_ids:
+            return 0
+
+        try:
+            return await self.db.mangaseries.update_many(
+                where={"id": {"in": series_ids}, "lease_owner": owner},
+                data={
+                    "lease_expires_at": datetime.now(timezone.utc)
+                    + timedelta(seconds=lease_seconds)
+                },
+            )
+        except Exception as e:
+            self.logger.error(f"❌ Lỗi gia hạn lease: {e}")
+            return 0
+
+    async def release_series_lease(
+        self,
+        series_id: int,
+        owner: str,
+        cooldown_seconds: int = 0,
+        checked: bool = False,
+        next_check_at: Optional[datetime] = None,
+    ) -> None:
+        """Trả lease; series không được claim lại trong cooldown_seconds.
+
+        checked=True khi series đã được xử lý thành công (ghi last_checked_at),
+        kèm next_check_at là lần kiểm tra tiếp theo nếu có.
+        """
+        now = datetime.now(timezone.utc)
+        data = {
+            "lease_owner": None,
+            "lease_expires_at": now + timedelta(seconds=cooldown_seconds),
+        }
+        if checked:
+            data["last_checked_at"] = now
+        if next_check_at is not None:
+            data["next_check_at"] = next_check_at
+        try:
+            await self.db.mangaseries.update_many(
+                where={"id": series_id, "lease_owner": owner}, data=data
+            )
+        except Exception as e:
+            self.logger.error(f"❌ Lỗi trả lease series {series_id}: {e}")
+
+    async def reset_stuck_downloads(self):
+        """Reset các chapter kẹt ở DOWNLOADING của series không còn ai giữ lease"""
+        try:
+            now = datetime.now(timezone.utc)
+            reset_count = await self.db.mangachapter.update_many(
+                where={
+                    "download_status": "DOWNLOADING",
+                    "series": {
+                        "is": {
+                            "OR": [
+                                {"lease_expires_at": None},
+                                {"lease_expires_at": {"lt": now}},
+                            ]
+                        }
+                    },
+                },
+                data={"download_status": "PENDING"},
+            )
 
             if reset_count > 0:
                 self.logger.info(f"🔄 Đã reset {reset_count} chapters bị kẹt")
@@ -220,26 +543,70 @@ class LeecheDatabaseManager:
             self.logger.error(f"❌ Lỗi thêm chapter {chapter_number}: {e}")
             return None
 
+    async def add_chapters(
+        self, series_id: int, chapters: List[Dict[str, Any]]
+    ) -> Dict[str, MangaChapter]:
+        """Thêm/reset nhiều chapter trong một batch, trả về map chapter_url -> chapter"""
+        valid_chapters = [ch for ch in chapters if ch["chapter_number"] is not None]
+        if len(valid_chapters) < len(chapters):
+            self.logger.warning(
+                f"⚠️ Bỏ qua {len(chapters) - len(valid_chapters)} chapter không có số"
+            )
+        if not valid_chapters:
+            return {}
+
+        try:
+            async with self.db.batch_() as batcher:
+                for ch in valid_chapters:
+                    batcher.mangachapter.upsert(
+                        where={
+                            "series_id_chapter_url": {
+                                "series_id": series_id,
+                                "chapter_url": ch["chapter_url"],
+                            }
+                        },
+                        data={
+                            "create": {"series_id": series_id, **ch},
+                            "update": {
+                                "chapter_number": ch["chapter_number"],
+                                "chapter_title": ch["chapter_title"],
+                                "download_status": "PENDING",
+                                "downloaded_at": None,
+                            },
+                        },
+                    )
+
+            created = await self.db.mangachapter.find_many(
+                where={
+                    "series_id": series_id,
+                    "chapter_url": {"in": [ch["chapter_url"] for ch in valid_chapters]},
+                }
+            )
+            return {chapter.chapter_url: chapter for chapter in created}
+        except Exception as e:
+            self.logger.error(f"❌ Lỗi thêm chapters series {series_id}: {e}")
+            return {}
+
     async def update_chapter_status(
         self, chapter_id: int, status: str, image_count: Optional[int] = None
     ) -> None:
-        """Cập nhật trạng thái chapter"""
-        try:
-            update_data: Dict[str, Any] = {"download_status": status}
+        """Cập nhật trạng thái chapter (write-behind, gộp theo chapter)"""
+        update_data: Dict[str, Any] = {"download_status": status}
 
-            if status == "COMPLETED":
-                update_data["downloaded_at"] = datetime.now()
+        if status == "COMPLETED":
+            update_data["downloaded_at"] = datetime.now()
 
-            if image_count is not None:
-                update_data["image_count"] = image_count
+        if image_count is not None:
+            update_data["image_count"] = image_count
 
-            await self.db.mangachapter.update(
-                where={"id": chapter_id}, data=update_data
-            )
-            self.logger.debug(f"✅ Đã cập nhật chapter {chapter_id} -> {status}")
+        merged = self._pending_status.pop(chapter_id, {})
+        merged.pop("downloaded_at", None)
+        merged.update(update_data)
+        self._pending_status[chapter_id] = merged
+        self.logger.debug(f"✅ Đã xếp hàng cập nhật chapter {chapter_id} -> {status}")
 
-        except Exception as e:
-            self.logger.error(f"❌ Lỗi cập nhật chapter {chapter_id}: {e}")
+        if len(self._pending_status) >= self.STATUS_FLUSH_MAX_ITEMS:
+            await self.flush()
 
     async def get_pending_chapters(self, series_id: int) -> List[MangaChapter]:
         """Lấy danh sách chapter pending của truyện"""
@@ -275,6 +642,33 @@ class LeecheDatabaseManager:
             self.logger.error(f"Lỗi lấy chapters series {series_id}: {e}")
             return []
 
+    async def get_known_chapters(self, series_id: int) -> Dict[str, Dict[str, Any]]:
+        """Lấy toàn bộ chapter đã biết của series trong một query.
+
+        Trả về map chapter_url -> {"status", "number", "title"}; đủ để diff
+        với danh sách trên web và tải lại chapter chưa xong mà không cần
+        trang truyện liệt kê lại chúng.
+        """
+        try:
+            await self.flush()
+            rows = await self.db.query_raw(
+                "SELECT chapter_url, download_status::text AS download_status, "
+                "chapter_number, chapter_title "
+                "FROM manga_chapters WHERE series_id = $1",
+                series_id,
+            )
+            return {
+                row["chapter_url"]: {
+                    "status": row["download_status"],
+                    "number": row["chapter_number"],
+                    "title": row["chapter_title"],
+                }
+                for row in rows
+            }
+        except Exception as e:
+            self.logger.error(f"❌ Lỗi lấy trạng thái chapters series {series_id}: {e}")
+            return {}
+
     async def get_chapter_by_url(
         self, series_id: int, chapter_url: str
     ) -> Optional[MangaChapter]:
@@ -302,14 +696,16 @@ class LeecheDatabaseManager:
         image_order: int,
         local_path: Optional[str] = None,
         file_size: Optional[int] = None,
+        sub_index: int = 0,
     ) -> Optional[ChapterImage]:
-        """Thêm ảnh vào chapter"""
+        """Thêm ảnh vào chapter (sub_index > 0 cho các tile của ảnh bị cắt)"""
         try:
             return await self.db.chapterimage.upsert(
                 where={
-                    "chapter_id_image_order": {
+                    "chapter_id_image_order_sub_index": {
                         "chapter_id": chapter_id,
                         "image_order": image_order,
+                        "sub_index": sub_index,
                     }
                 },
                 data={
@@ -317,6 +713,7 @@ class LeecheDatabaseManager:
                         "chapter_id": chapter_id,
                         "image_url": image_url,
                         "image_order": image_order,
+                        "sub_index": sub_index,
                         "local_path": local_path,
                         "file_size": file_size,
                         "download_status": "COMPLETED" if local_path else "PENDING",
@@ -335,13 +732,16 @@ class LeecheDatabaseManager:
             )
             return None
 
-    async def bulk_add_chapter_images(self, image_records: list[dict]):
+    async def bulk_add_chapter_images(
+        self, image_records: list[dict], skip_duplicates: bool = False
+    ):
         if not image_records:
             return 0
 
         try:
-            await self.db.chapterimage.create_many(data=image_records)
-            return len(image_records)
+            return await self.db.chapterimage.create_many(
+                data=image_records, skip_duplicates=skip_duplicates
+            )
         except Exception as e:
             self.logger.error(f"❌ Bulk insert failed: {e}")
             return 0
@@ -351,7 +751,7 @@ class LeecheDatabaseManager:
         try:
             images = await self.db.chapterimage.find_many(
                 where={"chapter_id": chapter_id},
-                order=[{"image_order": "asc"}],
+                order=[{"image_order": "asc"}, {"sub_index": "asc"}],
             )
             return images or []
         except Exception as e:
@@ -366,6 +766,29 @@ class LeecheDatabaseManager:
         except Exception as e:
             self.logger.error(f"❌ Lỗi xóa ảnh chapter {chapter_id}: {e}")
 
+    # ==================== IMAGE BLOB (DEDUP) METHODS ====================
+
+    async def get_image_blob(self, content_hash: str) -> Optional[ImageBlob]:
+        """Tìm object đã lưu theo hash nội dung"""
+        try:
+            return await self.db.imageblob.find_unique(where={"hash": content_hash})
+        except Exception as e:
+            self.logger.error(f"❌ Lỗi lấy image blob {content_hash}: {e}")
+            return None
+
+    async def add_image_blobs(self, blob_records: list[dict]) -> int:
+        """Ghi mapping hash -> object, bỏ qua hash đã tồn tại"""
+        if not blob_records:
+            return 0
+
+        try:
+            return await self.db.imageblob.create_many(
+                data=blob_records, skip_duplicates=True
+            )
+        except Exception as e:
+            self.logger.error(f"❌ Lỗi thêm image blobs: {e}")
+            return 0
+
     # ==================== HEALTH CHECK ====================
 
     async def health_check(self):
@@ -1,14 +1,22 @@
 from abc import ABC, abstractmethod
 from urllib.parse import urljoin
+import hashlib
 import requests
 import re
 import logging
-from typing import List, Dict
+import threading
+from datetime import datetime
+from typing import AbstractSet, Any, List, Dict, Optional, Tuple
+
+from leecher.html_backend import HtmlBackend, create_html_backend
+from shared.executors import ExecutorRegistry
+from shared.page_cache import PageNotModified, PageValidators
 
 
 class BaseMangaParser(ABC):
     """Abstract base class cho tất cả parser"""
 
+    DEFAULT_TIMEOUT = 30
     HEADERS = {
         "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36",
         "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8",
@@ -26,21 +34,285 @@ class BaseMangaParser(ABC):
         r"chapter\s*(\d+\.?\d*)",
         r"(\d+\.?\d+)",
     ]
+    # None = lxml nếu có, không thì bs4 (xem leecher.html_backend)
+    HTML_BACKEND: Optional[str] = None
+    HEADER_CHARSET = re.compile(r"charset=[\"']?([\w.:-]+)", re.I)
+    META_CHARSET = re.compile(rb"<meta[^>]+charset=[\"']?([\w.:-]+)", re.I)
+    # Số chapter đã biết liên tiếp (từ mới nhất trở xuống) để dừng parse sớm;
+    # lớn hơn 1 để một chapter bị chèn/xóa lẻ tẻ không làm dừng nhầm
+    KNOWN_CHAPTER_RUN = 3
+    # Trang "mới cập nhật" của source, tương đối với base_url, {page} từ 1;
+    # None = source không có feed, phải kiểm tra từng series
+    RECENT_UPDATES_PATH: Optional[str] = None
+    RECENT_UPDATES_MAX_PAGES = 5
+    # Chuẩn HTML đặt meta charset trong 1024 byte đầu; quét rộng hơn cho chắc
+    META_CHARSET_SCAN_BYTES = 4096
 
-    def __init__(self, session: requests.Session = None):
-        self.session = session or requests.Session()
-        self.session.headers.update(self.HEADERS)
+    def __init__(self, session: requests.Session = None, client=None):
+        if session is not None:
+            session.headers.update(self.HEADERS)
+        # requests.Session chỉ cần cho đường sync; có client thì tạo khi cần
+        self._session = session
+        self._session_lock = threading.Lock()
+        # AsyncHttpSession dùng chung với leecher (pool kết nối theo source)
+        self.client = client
+        self.html: HtmlBackend = create_html_backend(self.HTML_BACKEND)
         self.logger = logging.getLogger(self.__class__.__name__)
 
+    @property
+    def session(self) -> requests.Session:
+        with self._session_lock:
+            if self._session is None:
+                self._session = requests.Session()
+                self._session.headers.update(self.HEADERS)
+            return self._session
+
     @abstractmethod
-    def get_chapter_list(self, series_url: str) -> List[Dict[str, str]]:
-        """Lấy danh sách chapter từ trang truyện"""
+    def parse_chapter_list(
+        self,
+        html: str,
+        series_url: str,
+        known_urls: Optional[AbstractSet[str]] = None,
+    ) -> List[Dict[str, str]]:
+        """Parse danh sách chapter từ HTML trang truyện.
+
+        known_urls: URL các chapter đã có; parser có thể dừng sớm khi gặp
+        một chuỗi chapter đã biết và chỉ trả về phần mới hơn.
+        """
         pass
 
     @abstractmethod
+    def parse_image_urls(self, html: str, chapter_url: str) -> List[str]:
+        """Parse danh sách URL ảnh từ HTML chapter"""
+        pass
+
+    def parse_recent_updates(self, html: str, page_url: str) -> List[Dict[str, Any]]:
+        """Parse trang mới cập nhật thành [{"url", "updated_at"}], mới nhất trước.
+
+        updated_at là datetime có timezone, None nếu không đọc được. Chỉ cần
+        override khi source có RECENT_UPDATES_PATH; mặc định không có series
+        nào nên discovery bỏ qua source.
+        """
+        return []
+
+    @property
+    def supports_recent_updates(self) -> bool:
+        return self.RECENT_UPDATES_PATH is not None
+
+    def decode_response(self, response) -> str:
+        """Giải mã body response thành text"""
+        return self.decode_html(
+            response.content, response.headers.get("Content-Type", "")
+        )
+
+    @classmethod
+    def decode_html(cls, content: bytes, content_type: str = "") -> str:
+        """Giải mã HTML theo charset ở header, rồi thẻ meta, mặc định utf-8.
+
+        Không đoán charset bằng thống kê trên toàn bộ body (chậm với trang
+        lớn); các site đều khai báo charset ở một trong hai chỗ trên.
+        """
+        match = cls.HEADER_CHARSET.search(
+            content_type or ""
+        ) or cls.META_CHARSET.search(content[: cls.META_CHARSET_SCAN_BYTES])
+        encoding = match.group(1) if match else "utf-8"
+        if isinstance(encoding, bytes):
+            encoding = encoding.decode("ascii")
+        try:
+            return content.decode(encoding, errors="ignore")
+        except LookupError:
+            return content.decode("utf-8", errors="ignore")
+
+    def chapter_list_fingerprint(self, html: str) -> Optional[str]:
+        """Hash của vùng danh sách chapter, tính trên text mà không parse DOM.
+
+        Mặc định hash cả trang sau khi gộp khoảng trắng; parser nên override
+        để chỉ lấy vùng danh sách chapter, bỏ phần hay đổi (quảng cáo, thời
+        gian tương đối...). None = không so được, luôn parse lại.
+        """
+        normalized = self.clean_text(html)
+        return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+    def _decode_with_fingerprint(self, response) -> Tuple[str, Optional[str]]:
+        html = self.decode_response(response)
+        return html, self.chapter_list_fingerprint(html)
+
+    def fetch_page(self, url: str) -> str:
+        """Tải trang HTML (đồng bộ)"""
+        response = self.session.get(url, timeout=self.DEFAULT_TIMEOUT)
+        response.raise_for_status()
+        return self.decode_response(response)
+
+    async def afetch_page(self, url: str) -> str:
+        """Tải trang HTML qua AsyncHttpSession, không chặn event loop"""
+        if self.client is None:
+            return await ExecutorRegistry.run("network", self.fetch_page, url)
+
+        response = await self.client.get(url, timeout=self.DEFAULT_TIMEOUT)
+        response.raise_for_status()
+        # Dò charset và decode cả trang tốn CPU: chạy ngoài event loop
+        return await ExecutorRegistry.run("cpu", self.decode_response, response)
+
+    def get_chapter_list(
+        self, series_url: str, known_urls: Optional[AbstractSet[str]] = None
+    ) -> List[Dict[str, str]]:
+        """Lấy danh sách chapter từ trang truyện"""
+        try:
+            html = self.fetch_page(series_url)
+            return self.parse_chapter_list(html, series_url, known_urls)
+        except Exception as e:
+            self.logger.error(f"Lỗi khi lấy chapter list: {e}")
+            return []
+
     def get_image_urls(self, chapter_url: str) -> List[str]:
         """Lấy danh sách URL ảnh từ chapter"""
-        pass
+        try:
+            html = self.fetch_page(chapter_url)
+            return self.parse_image_urls(html, chapter_url)
+        except Exception as e:
+            self.logger.error(f"Lỗi khi lấy image URLs: {e}")
+            return []
+
+    async def aget_chapter_list(
+        self, series_url: str, known_urls: Optional[AbstractSet[str]] = None
+    ) -> List[Dict[str, str]]:
+        """Bản async của get_chapter_list: I/O bất đồng bộ, parse trên executor cpu"""
+        try:
+            html = await self.afetch_page(series_url)
+            return await ExecutorRegistry.run(
+                "cpu", self.parse_chapter_list, html, series_url, known_urls
+            )
+        except Exception as e:
+            self.logger.error(f"Lỗi khi lấy chapter list: {e}")
+            return []
+
+    async def aget_chapter_list_if_changed(
+        self,
+        series_url: str,
+        cached: Optional[PageValidators],
+        known_urls: Optional[AbstractSet[str]] = None,
+    ) -> Tuple[List[Dict[str, str]], Optional[PageValidators]]:
+        """Như aget_chapter_list nhưng gửi GET có điều kiện từ validator cũ.
+
+        Raise PageNotModified khi server trả 304 hoặc hash vùng danh sách
+        chapter không đổi (không parse). Trả về validator mới để caller ghi
+        lại sau khi xử lý xong series.
+        """
+        headers = cached.request_headers() if cached else {}
+        try:
+            if self.client is None:
+                response = await ExecutorRegistry.run(
+                    "network",
+                    self.session.get,
+                    series_url,
+                    headers=headers,
+                    timeout=self.DEFAULT_TIMEOUT,
+                )
+            else:
+                response = await self.client.get(
+                    series_url, headers=headers, timeout=self.DEFAULT_TIMEOUT
+                )
+            if response.status_code == 304:
+                raise PageNotModified(series_url)
+            response.raise_for_status()
+
+            html, fingerprint = await ExecutorRegistry.run(
+                "cpu", self._decode_with_fingerprint, response
+            )
+            validators = PageValidators.from_response(response, fingerprint)
+            if (
+                cached
+                and validators.content_hash
+                and validators.content_hash == cached.content_hash
+            ):
+                raise PageNotModified(series_url)
+
+            chapters = await ExecutorRegistry.run(
+                "cpu", self.parse_chapter_list, html, series_url, known_urls
+            )
+            return chapters, validators
+        except PageNotModified:
+            raise
+        except Exception as e:
+            self.logger.error(f"Lỗi khi lấy chapter list: {e}")
+            return [], None
+
+    def get_recent_updates(
+        self, base_url: str, since: datetime
+    ) -> Optional[List[Dict[str, Any]]]:
+        """Các series được cập nhật từ since, theo trang mới cập nhật.
+
+        Trả về None nếu source không có feed, bị lỗi, hoặc quét hết
+        RECENT_UPDATES_MAX_PAGES trang mà chưa tới since: kết quả thiếu
+        thì không được dùng để bỏ qua các series còn lại.
+        """
+        if not self.supports_recent_updates:
+            return None
+
+        updates: List[Dict[str, Any]] = []
+        try:
+            for page in range(1, self.RECENT_UPDATES_MAX_PAGES + 1):
+                page_url = self._recent_updates_url(base_url, page)
+                items = self.parse_recent_updates(self.fetch_page(page_url), page_url)
+                if self._collect_recent_updates(items, since, updates):
+                    return updates
+        except Exception as e:
+            self.logger.error(f"Lỗi khi lấy trang mới cập nhật: {e}")
+            return None
+
+        self.logger.warning(f"⚠️ Feed chưa quét tới {since} sau {page} trang")
+        return None
+
+    async def aget_recent_updates(
+        self, base_url: str, since: datetime
+    ) -> Optional[List[Dict[str, Any]]]:
+        """Bản async của get_recent_updates: I/O bất đồng bộ, parse trên executor cpu"""
+        if not self.supports_recent_updates:
+            return None
+
+        updates: List[Dict[str, Any]] = []
+        try:
+            for page in range(1, self.RECENT_UPDATES_MAX_PAGES + 1):
+                page_url = self._recent_updates_url(base_url, page)
+                html = await self.afetch_page(page_url)
+                items = await ExecutorRegistry.run(
+                    "cpu", self.parse_recent_updates, html, page_url
+                )
+                if self._collect_recent_updates(items, since, updates):
+                    return updates
+        except Exception as e:
+            self.logger.error(f"Lỗi khi lấy trang mới cập nhật: {e}")
+            return None
+
+        self.logger.warning(f"⚠️ Feed chưa quét tới {since} sau {page} trang")
+        return None
+
+    def _recent_updates_url(self, base_url: str, page: int) -> str:
+        return self.normalize_url(self.RECENT_UPDATES_PATH.format(page=page), base_url)
+
+    @staticmethod
+    def _collect_recent_updates(
+        items: List[Dict[str, Any]], since: datetime, updates: List[Dict[str, Any]]
+    ) -> bool:
+        """Thêm các mục mới hơn since vào updates; True khi đã quét tới since"""
+        if not items:
+            return True
+        for item in items:
+            if item["updated_at"] is not None and item["updated_at"] < since:
+                return True
+            updates.append(item)
+        return False
+
+    async def aget_image_urls(self, chapter_url: str) -> List[str]:
+        """Bản async của get_image_urls: I/O bất đồng bộ, parse trên executor cpu"""
+        try:
+            html = await self.afetch_page(chapter_url)
+            return await ExecutorRegistry.run(
+                "cpu", self.parse_image_urls, html, chapter_url
+            )
+        except Exception as e:
+            self.logger.error(f"Lỗi khi lấy image URLs: {e}")
+            return []
 
     def extract_chapter_number(self, text: str) -> str:
         """Trích xuất số chapter từ text"""
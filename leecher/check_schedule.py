@@ -0,0 +1,112 @@
+import heapq
+import random
+import statistics
+from datetime import datetime, timedelta
+from typing import Iterable, List, Optional, Set, Tuple
+
+
+class CheckPolicy:
+    """Tính thời điểm kiểm tra tiếp theo của series từ nhịp ra chapter.
+
+    Khoảng cách giữa các lần ra chapter gần đây (theo thời điểm chapter
+    được phát hiện) cho biết series ra theo ngày, theo tuần hay đã ngừng;
+    series được kiểm tra vài lần trong mỗi khoảng đó. Thời điểm được cộng
+    thêm jitter để các series cùng nhịp không dồn vào cùng một lúc.
+    """
+
+    RELEASE_HISTORY = 10
+    # Các chapter phát hiện cách nhau dưới khoảng này tính là một lần ra
+    RELEASE_MERGE_GAP = timedelta(hours=1)
+    CHECKS_PER_RELEASE = 4
+    MIN_INTERVAL = timedelta(hours=1)
+    MAX_INTERVAL = timedelta(days=3)
+    # Chưa đủ lịch sử để đoán nhịp
+    DEFAULT_INTERVAL = timedelta(days=1)
+    DORMANT_AFTER = timedelta(days=60)
+    DORMANT_INTERVAL = timedelta(days=7)
+    COMPLETED_INTERVAL = timedelta(days=30)
+    JITTER = 0.1
+
+    @classmethod
+    def interval(
+        cls, status: str, release_times: Iterable[datetime], now: datetime
+    ) -> timedelta:
+        if status == "COMPLETED":
+            return cls.COMPLETED_INTERVAL
+
+        releases = cls._releases(release_times)
+        if not releases:
+            return cls.DEFAULT_INTERVAL
+        if now - releases[0] > cls.DORMANT_AFTER:
+            return cls.DORMANT_INTERVAL
+        if len(releases) < 3:
+            return cls.DEFAULT_INTERVAL
+
+        gaps = [newer - older for newer, older in zip(releases, releases[1:])]
+        cadence = statistics.median(gaps)
+        return min(
+            cls.MAX_INTERVAL, max(cls.MIN_INTERVAL, cadence / cls.CHECKS_PER_RELEASE)
+        )
+
+    @classmethod
+    def next_check_at(
+        cls,
+        status: str,
+        release_times: Iterable[datetime],
+        now: datetime,
+        rng: random.Random = random,
+    ) -> datetime:
+        interval = cls.interval(status, release_times, now)
+        return now + interval * rng.uniform(1 - cls.JITTER, 1 + cls.JITTER)
+
+    @classmethod
+    def _releases(cls, release_times: Iterable[datetime]) -> List[datetime]:
+        """Các lần ra chapter, mới nhất trước, gộp những chapter ra cùng đợt"""
+        releases: List[datetime] = []
+        for released_at in sorted(release_times, reverse=True):
+            if not releases or releases[-1] - released_at >= cls.RELEASE_MERGE_GAP:
+                releases.append(released_at)
+        return releases[: cls.RELEASE_HISTORY]
+
+
+class CheckSchedule:
+    """Hàng đợi ưu tiên (heap) series_id theo thời điểm tới hạn kiểm tra.
+
+    Chỉ dùng để biết khi nào cần thức dậy; việc series nào thực sự được
+    xử lý vẫn do claim_series trong DB quyết định (nhiều node dùng chung).
+    Cập nhật lại hạn của một series không xóa mục cũ khỏi heap mà đánh dấu
+    bằng bản ghi hạn mới nhất, mục cũ bị bỏ qua khi pop.
+    """
+
+    def __init__(self):
+        self._heap: List[Tuple[datetime, int]] = []
+        self._due = {}
+
+    def __len__(self) -> int:
+        return len(self._due)
+
+    def push(self, series_id: int, due_at: datetime) -> None:
+        self._due[series_id] = due_at
+        heapq.heappush(self._heap, (due_at, series_id))
+
+    def rebuild(self, entries: Iterable[Tuple[int, datetime]]) -> None:
+        self._due = dict(entries)
+        self._heap = [(due_at, series_id) for series_id, due_at in self._due.items()]
+        heapq.heapify(self._heap)
+
+    def next_due(self) -> Optional[datetime]:
+        self._drop_stale()
+        return self._heap[0][0] if self._heap else None
+
+    def pop_due(self, now: datetime) -> Set[int]:
+        """Lấy ra các series đã tới hạn"""
+        due: Set[int] = set()
+        while self.next_due() is not None and self._heap[0][0] <= now:
+            _, series_id = heapq.heappop(self._heap)
+            self._due.pop(series_id, None)
+            due.add(series_id)
+        return due
+
+    def _drop_stale(self) -> None:
+        while self._heap and self._due.get(self._heap[0][1]) != self._heap[0][0]:
+            heapq.heappop(self._heap)
@@ -0,0 +1,121 @@
+import threading
+from abc import ABC, abstractmethod
+from typing import Any, Dict, List, Optional
+
+from shared.logger import logging
+
+logger = logging.getLogger(__name__)
+
+
+class HtmlBackend(ABC):
+    """Giao diện trích xuất HTML dùng chung cho các parser.
+
+    Parser chỉ làm việc qua parse/select/text/attr nên có thể đổi thư viện
+    parse HTML mà không phải viết lại logic trích xuất.
+    """
+
+    name = ""
+
+    @abstractmethod
+    def parse(self, html: str) -> Any:
+        """Parse HTML thành node gốc"""
+
+    @abstractmethod
+    def select(self, node: Any, selector: str) -> List[Any]:
+        """Các node con khớp CSS selector, theo thứ tự trong tài liệu"""
+
+    def select_one(self, node: Any, selector: str) -> Optional[Any]:
+        matches = self.select(node, selector)
+        return matches[0] if matches else None
+
+    @abstractmethod
+    def text(self, node: Any) -> str:
+        """Toàn bộ text bên trong node"""
+
+    @abstractmethod
+    def attr(self, node: Any, name: str) -> Optional[str]:
+        """Giá trị attribute, None nếu không có"""
+
+
+class LxmlBackend(HtmlBackend):
+    """Backend lxml (libxml2, viết bằng C) với CSS selector biên dịch sẵn.
+
+    Selector được biên dịch sang XPath một lần rồi dùng lại; mỗi thread giữ
+    bản biên dịch riêng vì các parse chạy song song trên executor "cpu".
+    """
+
+    name = "lxml"
+
+    def __init__(self):
+        from lxml import html as lxml_html
+        from lxml.cssselect import CSSSelector
+
+        self._lxml_html = lxml_html
+        self._css_selector = CSSSelector
+        self._local = threading.local()
+
+    def _compiled(self, selector: str):
+        cache: Dict[str, Any] = getattr(self._local, "selectors", None)
+        if cache is None:
+            cache = self._local.selectors = {}
+        if selector not in cache:
+            cache[selector] = self._css_selector(selector)
+        return cache[selector]
+
+    def parse(self, html: str) -> Any:
+        if not html or not html.strip():
+            return self._lxml_html.document_fromstring("<html></html>")
+        try:
+            return self._lxml_html.document_fromstring(html)
+        except ValueError:
+            # str có khai báo <?xml encoding=...?> phải parse từ bytes
+            return self._lxml_html.document_fromstring(html.encode("utf-8"))
+
+    def select(self, node: Any, selector: str) -> List[Any]:
+        return self._compiled(selector)(node)
+
+    def text(self, node: Any) -> str:
+        return node.text_content()
+
+    def attr(self, node: Any, name: str) -> Optional[str]:
+        return node.get(name)
+
+
+class BeautifulSoupBackend(HtmlBackend):
+    """Backend BeautifulSoup + html.parser thuần Python, dùng khi thiếu lxml"""
+
+    name = "bs4"
+
+    def parse(self, html: str) -> Any:
+        from bs4 import BeautifulSoup
+
+        return BeautifulSoup(html, "html.parser")
+
+    def select(self, node: Any, selector: str) -> List[Any]:
+        return node.select(selector)
+
+    def select_one(self, node: Any, selector: str) -> Optional[Any]:
+        return node.select_one(selector)
+
+    def text(self, node: Any) -> str:
+        return node.get_text()
+
+    def attr(self, node: Any, name: str) -> Optional[str]:
+        return node.get(name)
+
+
+HTML_BACKENDS = {
+    LxmlBackend.name: LxmlBackend,
+    BeautifulSoupBackend.name: BeautifulSoupBackend,
+}
+
+
+def create_html_backend(name: Optional[str] = None) -> HtmlBackend:
+    """Tạo backend theo tên; mặc định lxml, lùi về bs4 nếu chưa cài lxml"""
+    if name:
+        return HTML_BACKENDS[name]()
+    try:
+        return LxmlBackend()
+    except ImportError:
+        logger.warning("⚠️ Chưa cài lxml/cssselect, dùng BeautifulSoup")
+        return BeautifulSoupBackend()
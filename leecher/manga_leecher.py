@@ -1,57 +1,113 @@
 import asyncio
+import math
 from pathlib import Path
-import requests
-from requests.adapters import HTTPAdapter
-from urllib3.util.retry import Retry
-from typing import Dict
+from typing import Dict, List, Optional, Set, Tuple
+from urllib.parse import urlparse
 import logging
+from leecher.base_parser import BaseMangaParser
 from leecher.parser_factory import ParserFactory
+from leecher.prefetcher import ImageListPrefetcher
+from shared.http_client import AsyncHttpSession
+from shared.concurrency import AdaptiveConcurrencyLimiter, ConcurrencyLimiter
+from shared.dedup_index import DedupIndex
+from shared.executors import ExecutorRegistry
+from shared.image_download import DownloadedImage, ImageDownloader, ImageRejected
 from shared.image_utils import ImageConverter
-from shared.r2_storage import R2Storage
+from shared.memory_budget import MemoryBudget
+from shared.metrics import Metrics
+from shared.page_cache import PageNotModified, PageValidatorCache
+from shared.pipeline import StagedPipeline
+from shared.r2_uploader import R2Uploader
+from shared.rate_limiter import RateLimiterRegistry, SharedRateLimitTable
 from shared.storage_utils import StorageUtils
+from shared.webp_encoder import WebPEncoder
 
 
 class MangaLeecher:
     """Core leecher cho truyện tranh"""
 
     DEFAULT_TIMEOUT = 30
-    DELAY_BETWEEN_CHAPTERS = 3
-    DELAY_BETWEEN_IMAGES = 0.3
-    MAX_CONCURRENT_CHAPTERS = 2
-    MAX_CONCURRENT_IMAGES = 15
+    # Giới hạn khởi điểm; limiter tự điều chỉnh theo latency/throughput
+    INITIAL_CONCURRENT_IMAGES = 15
+    INITIAL_CONCURRENT_UPLOADS = 15
+    MIN_CONCURRENT_CHAPTERS = 2
+    # Số ảnh in-flight cho mỗi chapter chạy song song
+    IMAGES_PER_CHAPTER_SLOT = 10
+    # Số worker cho từng stage của pipeline ảnh (mỗi chapter)
+    FETCH_WORKERS = 16
+    UPLOAD_WORKERS = 8
+    RECORD_BATCH_SIZE = 20
+    # Số chapter lấy trước danh sách ảnh
+    PREFETCH_CHAPTERS = 3
     WEBP_QUALITY = 85
+    # Cắt strip cao hơn giới hạn WebP thành nhiều tile thay vì thu nhỏ
+    TILE_TALL_IMAGES = True
+    # Upload nguyên bản WebP nguồn nếu không vượt ngân sách bytes/pixel
+    WEBP_PASSTHROUGH = True
+    WEBP_PASSTHROUGH_MAX_BPP = ImageConverter.DEFAULT_PASSTHROUGH_MAX_BPP
+    # Đủ để đọc kích thước từ header VP8/VP8L/VP8X
+    PASSTHROUGH_PROBE_BYTES = 32
 
     def __init__(
-        self, db_manager, storage_path: str = "manga_storage", enable_r2: bool = False
+        self,
+        db_manager,
+        storage_path: str = "manga_storage",
+        enable_r2: bool = False,
+        rate_limit_table: Optional[SharedRateLimitTable] = None,
     ):
         self.db = db_manager
         self.storage_path = Path(storage_path)
         self.storage_path.mkdir(parents=True, exist_ok=True)
-        self.session_pool: Dict[str, requests.Session] = {}
+        self.session_pool: Dict[str, AsyncHttpSession] = {}
+        self.rate_limiters = RateLimiterRegistry(rate_limit_table)
         self.logger = logging.getLogger(__name__)
-        self.chapter_semaphore = asyncio.Semaphore(self.MAX_CONCURRENT_CHAPTERS)
-        self.image_semaphore = asyncio.Semaphore(self.MAX_CONCURRENT_IMAGES)
+        ExecutorRegistry.acquire()
+        self.cdn_limiter = AdaptiveConcurrencyLimiter(
+            "cdn", self.INITIAL_CONCURRENT_IMAGES
+        )
+        self.r2_limiter = AdaptiveConcurrencyLimiter(
+            "r2",
+            self.INITIAL_CONCURRENT_UPLOADS,
+            max_limit=ExecutorRegistry.size("storage"),
+        )
+        self.chapter_limiter = ConcurrencyLimiter(
+            "chapters", self._chapter_concurrency()
+        )
         self.image_converter = ImageConverter()
+        # Ngân sách bộ nhớ chung cho ảnh in-flight của mọi series
+        self.memory_budget = MemoryBudget()
+        self.image_downloader = ImageDownloader(memory_budget=self.memory_budget)
+        self.webp_encoder = WebPEncoder(memory_budget=self.memory_budget)
 
         # R2 Storage
         self.enable_r2 = enable_r2
-        self.r2_storage = R2Storage() if enable_r2 else None
+        self.r2_uploader = R2Uploader(self.r2_limiter) if enable_r2 else None
+        self.dedup_index = DedupIndex(
+            self.db, self.storage_path, "r2" if enable_r2 else "local"
+        )
+        self.page_cache = PageValidatorCache(self.storage_path)
 
-    def get_session_for_source(self, source_name: str) -> requests.Session:
+    def get_session_for_source(self, source_name: str) -> AsyncHttpSession:
         if source_name not in self.session_pool:
-            session = requests.Session()
-            retry_strategy = Retry(
-                total=3, backoff_factor=2, respect_retry_after_header=True
-            )
-            adapter = HTTPAdapter(
-                pool_connections=5, pool_maxsize=15, max_retries=retry_strategy
+            self.session_pool[source_name] = AsyncHttpSession(
+                source_name,
+                headers=BaseMangaParser.HEADERS,
+                rate_limiters=self.rate_limiters,
             )
-            session.mount("http://", adapter)
-            session.mount("https://", adapter)
-            self.session_pool[source_name] = session
         return self.session_pool[source_name]
 
+    async def close(self) -> None:
+        """Đóng các HTTP session, process pool encode và các executor"""
+        for session in self.session_pool.values():
+            await session.aclose()
+        self.session_pool.clear()
+        await self.webp_encoder.aclose()
+        self.dedup_index.close()
+        self.page_cache.close()
+        await ExecutorRegistry.release()
+
     async def download_series(self, series_id: int) -> bool:
+        series = None
         try:
             series = await self.db.get_series_by_id(series_id)
             if not series:
@@ -60,86 +116,155 @@ class MangaLeecher:
 
             self.logger.info(f"📖 Tải: {series.title} [{series.source.name}]")
 
+            # Rate limit theo source lấy từ DB, áp dụng cho từng host
+            self.rate_limiters.configure_source(
+                series.source.name,
+                series.source.rate_limit_per_minute,
+                urlparse(series.source.base_url).hostname,
+                urlparse(series.target_url).hostname,
+            )
             session = self.get_session_for_source(series.source.name)
-            parser = ParserFactory.create_parser(series.source.name, session)
-            web_chapters = parser.get_chapter_list(series.target_url)
+            parser = ParserFactory.create_parser(series.source.name, client=session)
+            # Một query cho toàn bộ chapter đã biết; parser dừng khi gặp chuỗi
+            # chapter đã xong nên chỉ phần mới nhất của trang được xử lý
+            known_chapters = await self.db.get_known_chapters(series_id)
+            completed_urls = {
+                url
+                for url, row in known_chapters.items()
+                if row["status"] == "COMPLETED"
+            }
+            # Validator cũ chỉ có nghĩa khi DB còn giữ các chapter đã tải
+            cached = self.page_cache.get(series.target_url) if completed_urls else None
+            not_modified = False
+            try:
+                web_chapters, validators = await parser.aget_chapter_list_if_changed(
+                    series.target_url, cached, known_urls=completed_urls
+                )
+                PageValidatorCache.record("changed")
+            except PageNotModified:
+                PageValidatorCache.record("not_modified")
+                not_modified = True
+                web_chapters, validators = [], None
 
-            if not web_chapters:
+            if not web_chapters and not not_modified:
                 self.logger.error(f"Không tìm thấy chapter: {series.title}")
                 return False
 
-            db_chapters = await self.db.get_chapters_by_series(
-                series_id, include_deleted=True
+            web_urls = {ch["url"] for ch in web_chapters}
+            # Chapter cũ chưa xong nằm sau điểm dừng: tải lại từ dữ liệu trong DB
+            unfinished_chapters = sorted(
+                (
+                    {"url": url, "number": row["number"], "title": row["title"]}
+                    for url, row in known_chapters.items()
+                    if row["status"] != "COMPLETED" and url not in web_urls
+                ),
+                key=lambda ch: ch["number"],
             )
+            chapters_to_download = unfinished_chapters + [
+                ch for ch in web_chapters if ch["url"] not in completed_urls
+            ]
 
-            if len(web_chapters) == len(db_chapters):
-                self.logger.info(
-                    f"✅ Series '{series.title}' đã có đủ chapters, bỏ qua"
-                )
+            if not chapters_to_download:
+                if not_modified:
+                    self.logger.info(f"📄 Trang '{series.title}' không đổi, bỏ qua")
+                else:
+                    self.logger.info(
+                        f"✅ Series '{series.title}' đã có đủ chapters, bỏ qua"
+                    )
+                self._remember_validators(series.target_url, validators)
                 return True
 
-            chapters_to_download = []
-            for chapter_info in web_chapters:
-                if not await self.db.get_chapter_by_url(series_id, chapter_info["url"]):
-                    chapters_to_download.append(chapter_info)
-
             self.logger.info(f"🚀 Tải {len(chapters_to_download)} chapters mới")
 
+            # Tạo/reset toàn bộ chapter cần tải trong một batch
+            created_chapters = await self.db.add_chapters(
+                series_id,
+                [
+                    {
+                        "chapter_number": self.parse_chapter_number(ch["number"]),
+                        "chapter_title": ch["title"],
+                        "chapter_url": ch["url"],
+                    }
+                    for ch in chapters_to_download
+                ],
+            )
+
+            # Lấy trước danh sách ảnh của các chapter kế tiếp trong nền
+            image_lists = ImageListPrefetcher(
+                parser,
+                [ch["url"] for ch in chapters_to_download],
+                self.PREFETCH_CHAPTERS,
+            ).start()
             tasks = [
                 self._download_chapter_task(
-                    parser,
-                    series_id,
+                    image_lists,
+                    created_chapters.get(ch["url"]),
                     ch,
                     series.title,
                     series.source.name,
                     series.source.base_url,
+                    # Chapter đã có trong DB mà chưa xong: có thể đã upload dở
+                    resume=ch["url"] in known_chapters,
                 )
                 for ch in chapters_to_download
             ]
-            results = await asyncio.gather(*tasks, return_exceptions=True)
+            try:
+                results = await asyncio.gather(*tasks, return_exceptions=True)
+            finally:
+                await image_lists.aclose()
             await self.db.update_last_update_id(series_id)
 
-            success_count = len(db_chapters) + sum(1 for r in results if r is True)
+            success_count = sum(1 for r in results if r is True)
             self.logger.info(
-                f"✅ Hoàn thành: {success_count}/{len(web_chapters)} chapters"
+                f"✅ Hoàn thành: {success_count}/{len(chapters_to_download)} chapters"
             )
-            return success_count == len(web_chapters)
+            if success_count < len(chapters_to_download):
+                return False
+
+            # Chỉ ghi validator khi đã tải đủ, nếu không lần sau sẽ bỏ qua nhầm
+            self._remember_validators(series.target_url, validators)
+            return True
 
         except Exception as e:
             self.logger.error(f"Lỗi tải series {series_id}: {e}")
             return False
+        finally:
+            if self.r2_uploader and series:
+                self.r2_uploader.manifest.evict(
+                    StorageUtils.r2_series_prefix(series.title)
+                )
+
+    def _remember_validators(self, url: str, validators) -> None:
+        if validators is not None:
+            self.page_cache.put(url, validators)
 
     async def _download_chapter_task(
         self,
-        parser,
-        series_id: int,
+        image_lists: ImageListPrefetcher,
+        chapter,
         chapter_info: dict,
         series_title: str,
         source_name: str,
         source_url: str,
+        resume: bool = False,
     ) -> bool:
-        async with self.chapter_semaphore:
-            try:
-                chapter_number = self.parse_chapter_number(chapter_info["number"])
-                chapter = await self.db.add_chapter(
-                    series_id=series_id,
-                    chapter_number=chapter_number,
-                    chapter_title=chapter_info["title"],
-                    chapter_url=chapter_info["url"],
-                )
-                if not chapter:
-                    return False
+        if not chapter:
+            image_lists.discard(chapter_info["url"])
+            return False
 
+        await self.chapter_limiter.set_limit(self._chapter_concurrency())
+        async with self.chapter_limiter.slot():
+            try:
                 result = await self._download_chapter(
-                    parser,
+                    image_lists,
                     chapter.id,
                     chapter_info["url"],
                     series_title,
-                    chapter_number,
+                    self.parse_chapter_number(chapter_info["number"]),
                     source_name,
                     source_url,
+                    resume,
                 )
-                await asyncio.sleep(self.DELAY_BETWEEN_CHAPTERS)
                 return result
 
             except Exception as e:
@@ -148,18 +273,19 @@ class MangaLeecher:
 
     async def _download_chapter(
         self,
-        parser,
+        image_lists: ImageListPrefetcher,
         chapter_id: int,
         chapter_url: str,
         series_title: str,
         chapter_number: float,
         source_name: str,
         source_url: str,
+        resume: bool = False,
     ) -> bool:
         try:
             await self.db.update_chapter_status(chapter_id, "DOWNLOADING")
 
-            image_urls = parser.get_image_urls(chapter_url)
+            image_urls = await image_lists.get(chapter_url)
             if not image_urls:
                 self.logger.warning(f"Chapter {chapter_number}: không có ảnh")
                 await self.db.update_chapter_status(chapter_id, "FAILED")
@@ -178,8 +304,17 @@ class MangaLeecher:
                 if i not in completed_orders
             ]
 
+            # Ảnh đã PUT lên R2 nhưng chưa kịp ghi DB (crash, chapter PARTIAL);
+            # chapter mới chưa thể có gì trên R2 nên không cần list
+            recovered = 0
+            if resume:
+                images_to_download, recovered = await self._recover_uploaded_images(
+                    chapter_id, images_to_download, series_title, chapter_number
+                )
+            completed_count = len(completed_orders) + recovered
+
             self.logger.info(
-                f"📊 {series_title} - Chapter {chapter_number}: {len(completed_orders)}/{len(image_urls)} ảnh đã hoàn thành"
+                f"📊 {series_title} - Chapter {chapter_number}: {completed_count}/{len(image_urls)} ảnh đã hoàn thành"
             )
 
             if not images_to_download:
@@ -200,7 +335,7 @@ class MangaLeecher:
                 source_url,
             )
 
-            success_count = len(completed_orders) + parallel_success
+            success_count = completed_count + parallel_success
             status = "COMPLETED" if success_count == len(image_urls) else "PARTIAL"
             await self.db.update_chapter_status(chapter_id, status, success_count)
 
@@ -216,6 +351,55 @@ class MangaLeecher:
             await self.db.update_chapter_status(chapter_id, "FAILED")
             return False
 
+    async def _load_manifest(self, prefix: str) -> bool:
+        try:
+            await self.r2_uploader.manifest.load(prefix)
+            return True
+        except Exception as e:
+            self.logger.warning(f"⚠️ Không list được R2 prefix {prefix}: {e}")
+            return False
+
+    async def _recover_uploaded_images(
+        self,
+        chapter_id: int,
+        images_to_download: list,
+        series_title: str,
+        chapter_number: float,
+    ) -> Tuple[list, int]:
+        """Ghi DB cho ảnh đã có trên R2, trả về (ảnh còn phải tải, số ảnh khôi phục)"""
+        if not self.r2_uploader or not images_to_download:
+            return images_to_download, 0
+
+        prefix = StorageUtils.r2_chapter_prefix(series_title, chapter_number)
+        if not await self._load_manifest(prefix):
+            return images_to_download, 0
+
+        # Chỉ khôi phục ảnh đơn; tile có thể mới upload được một phần strip
+        uploaded = await self.r2_uploader.manifest.folder(prefix)
+        records = []
+        remaining = []
+        for order, url in images_to_download:
+            object_key = f"{prefix}{order:03d}.webp"
+            if object_key not in uploaded:
+                remaining.append((order, url))
+                continue
+            records.append(
+                self._image_record(
+                    chapter_id,
+                    url,
+                    order,
+                    0,
+                    self.r2_uploader.storage.get_public_url(object_key),
+                    uploaded[object_key][0],
+                )
+            )
+
+        # Không ghi được record thì các ảnh vẫn phải được tải lại
+        if records and await self._flush_image_records(records):
+            remaining = images_to_download
+        Metrics.inc("r2.manifest.recovered", len(images_to_download) - len(remaining))
+        return remaining, len(images_to_download) - len(remaining)
+
     async def _download_images_parallel(
         self,
         chapter_id: int,
@@ -225,108 +409,283 @@ class MangaLeecher:
         source_name: str,
         source_url: str,
     ) -> int:
-        tasks = [
-            self._download_image_task(
-                chapter_id,
-                url,
-                order,
-                series_title,
-                chapter_number,
-                source_name,
-                source_url,
+        """Tải ảnh qua pipeline fetch -> encode -> upload -> record.
+
+        Mỗi stage có hàng đợi giới hạn và số worker riêng nên CPU encode
+        không phải chờ mạng, upload không phải chờ encode; record được ghi
+        DB theo từng lô ngay khi có thay vì đợi cả chapter xong.
+        """
+        pending_records: List[dict] = []
+        # Ảnh đã upload nhưng record không ghi được DB: không tính là xong
+        failed_orders: Set[int] = set()
+
+        async def record_stage(job: dict) -> dict:
+            pending_records.extend(job["records"])
+            if len(pending_records) >= self.RECORD_BATCH_SIZE:
+                failed_orders.update(await self._flush_image_records(pending_records))
+            return job
+
+        pipeline = (
+            StagedPipeline("images", on_drop=self._release_job)
+            .add_stage("fetch", self._fetch_stage, self.FETCH_WORKERS)
+            .add_stage(
+                "encode",
+                self._encode_stage,
+                self.webp_encoder.max_workers * WebPEncoder.QUEUE_DEPTH_PER_WORKER,
             )
-            for order, url in images_to_download
-        ]
-        results = await asyncio.gather(*tasks, return_exceptions=True)
+            .add_stage("upload", self._upload_stage, self.UPLOAD_WORKERS)
+            .add_stage("record", record_stage, 1, self.RECORD_BATCH_SIZE)
+        )
 
-        image_records = [r for r in results if isinstance(r, dict)]
-        success_count = len(image_records)
-        if success_count > 0:
-            await self.db.bulk_add_chapter_images(image_records)
+        jobs = (
+            {
+                "chapter_id": chapter_id,
+                "image_url": url,
+                "order": order,
+                "series_title": series_title,
+                "chapter_number": chapter_number,
+                "source_name": source_name,
+                "source_url": source_url,
+            }
+            for order, url in images_to_download
+        )
+        try:
+            completed = await pipeline.run(jobs)
+        finally:
+            failed_orders.update(await self._flush_image_records(pending_records))
 
+        success_count = len({job["order"] for job in completed} - failed_orders)
         self.logger.info(f"✅ Đã tải {success_count}/{len(images_to_download)} ảnh")
         return success_count
 
-    async def _download_image_task(
-        self,
-        chapter_id: int,
-        image_url: str,
-        order: int,
-        series_title: str,
-        chapter_number: float,
-        source_name: str,
-        source_url: str,
-    ) -> bool:
+    async def _flush_image_records(self, pending_records: List[dict]) -> Set[int]:
+        """Ghi các record đang chờ, trả về image_order của ảnh không ghi được"""
+        if not pending_records:
+            return set()
+
+        written = await self.db.bulk_add_chapter_images(list(pending_records))
+        failed = set()
+        if written != len(pending_records):
+            failed = {record["image_order"] for record in pending_records}
+            self.logger.error(
+                f"❌ Chỉ ghi được {written}/{len(pending_records)} record ảnh, "
+                f"ảnh {sorted(failed)} chưa hoàn thành"
+            )
+        pending_records.clear()
+        return failed
+
+    async def _fetch_stage(self, job: dict) -> Optional[dict]:
+        order = job["order"]
+        session = self.get_session_for_source(job["source_name"])
+        headers = {"Referer": job["source_url"]}
+
         try:
-            session = self.get_session_for_source(source_name)
-            headers = {"Referer": source_url}
-
-            loop = asyncio.get_event_loop()
-            response = await loop.run_in_executor(
-                None,
-                lambda: session.get(
-                    image_url, headers=headers, timeout=self.DEFAULT_TIMEOUT
-                ),
+            image = await self.image_downloader.download(
+                session,
+                job["image_url"],
+                headers=headers,
+                timeout=self.DEFAULT_TIMEOUT,
+                concurrency=self.cdn_limiter,
             )
+        except ImageRejected as e:
+            self.logger.error(f"❌ Ảnh {order} bị từ chối: {e}")
+            return None
 
-            if response.status_code != 200:
-                self.logger.error(f"HTTP {response.status_code}: ảnh {order}")
-                return False
+        job["image"] = image
+        job["source_hash"] = self.dedup_index.hash_key(image.sha256)
+        stored = await self.dedup_index.lookup(job["source_hash"])
+        if stored:
+            self.dedup_index.record("source")
+            await job.pop("image").aclose()
+            job["records"] = [self._job_record(job, 0, *stored)]
+        return job
+
+    async def _encode_stage(self, job: dict) -> Optional[dict]:
+        if "records" in job:
+            return job
+
+        # Convert to WebP; phần ENCODED đã giữ được trả khi upload xong hoặc
+        # khi job bị loại (_release_job)
+        image = job.pop("image")
+        try:
+            job["encoded"] = await self._encode_image(image)
+            job["encoded_bytes"] = WebPEncoder.output_bytes(job["encoded"])
+        finally:
+            await image.aclose()
+        if not all(webp_data for webp_data, _ in job["encoded"]):
+            self.logger.error(f"❌ Convert WebP thất bại: ảnh {job['order']}")
+            return None
+        return job
 
-            # Convert to WebP
-            webp_data, file_size = await loop.run_in_executor(
-                None,
-                self.image_converter.to_webp,
-                response.content,
-                self.WEBP_QUALITY,
+    async def _upload_stage(self, job: dict) -> Optional[dict]:
+        if "records" in job:
+            return job
+
+        try:
+            return await self._upload_encoded(job)
+        finally:
+            await self.memory_budget.release(
+                job.pop("encoded_bytes"), MemoryBudget.ENCODED
             )
 
-            # Create object key for R2
-            safe_series = StorageUtils.sanitize_filename(series_title)
-            safe_chapter = StorageUtils.sanitize_filename(f"chapter_{chapter_number}")
-            r2_object_key = f"{safe_series}/{safe_chapter}/{order:03d}.webp"
-
-            # Upload to R2
-            if self.enable_r2 and self.r2_storage:
-                success, public_url = await loop.run_in_executor(
-                    None,
-                    self.r2_storage.upload_file,
-                    webp_data,
-                    r2_object_key,
-                    "image/webp",
-                )
+    async def _release_job(self, job: dict) -> None:
+        """Trả ngân sách bộ nhớ của job bị loại khỏi pipeline giữa chừng"""
+        if "image" in job:
+            await job.pop("image").aclose()
+        job.pop("encoded", None)
+        if "encoded_bytes" in job:
+            await self.memory_budget.release(
+                job.pop("encoded_bytes"), MemoryBudget.ENCODED
+            )
 
-                if not success:
-                    self.logger.error(f"❌ R2 upload failed: ảnh {order}")
-                    return False
+    async def _upload_encoded(self, job: dict) -> Optional[dict]:
+        order = job["order"]
+        encoded = job.pop("encoded")
+        if len(encoded) == 1:
+            webp_data, file_size = encoded[0]
+            stored = await self._store_deduplicated(
+                webp_data,
+                file_size,
+                job["source_hash"],
+                f"{order:03d}.webp",
+                job["series_title"],
+                job["chapter_number"],
+            )
+            if not stored:
+                self.logger.error(f"❌ R2 upload failed: ảnh {order}")
+                return None
+            job["records"] = [self._job_record(job, 0, *stored)]
+            return job
+
+        # Tile của strip lớn hầu như không lặp lại nên không dedup
+        self.dedup_index.record(None)
+        records = []
+        for sub_index, (webp_data, file_size) in enumerate(encoded):
+            storage_path = await self._store_image(
+                webp_data,
+                f"{order:03d}_{sub_index:02d}.webp",
+                job["series_title"],
+                job["chapter_number"],
+            )
+            if not storage_path:
+                self.logger.error(f"❌ R2 upload failed: ảnh {order}")
+                return None
+            records.append(self._job_record(job, sub_index, storage_path, file_size))
+
+        job["records"] = records
+        return job
+
+    def _job_record(
+        self, job: dict, sub_index: int, storage_path: str, file_size: int
+    ) -> dict:
+        return self._image_record(
+            job["chapter_id"],
+            job["image_url"],
+            job["order"],
+            sub_index,
+            storage_path,
+            file_size,
+        )
 
-                storage_path = public_url
-            else:
-                chapter_folder = StorageUtils.create_directory_structure(
-                    self.storage_path, series_title, chapter_number
-                )
-                filepath = chapter_folder / f"{order:03d}.webp"
-                await loop.run_in_executor(
-                    None, lambda: filepath.write_bytes(webp_data)
-                )
-                storage_path = str(
-                    StorageUtils.get_relative_path(self.storage_path, filepath)
-                )
+    @staticmethod
+    def _image_record(
+        chapter_id: int,
+        image_url: str,
+        order: int,
+        sub_index: int,
+        storage_path: str,
+        file_size: int,
+    ) -> dict:
+        return {
+            "chapter_id": chapter_id,
+            "image_url": image_url,
+            "image_order": order,
+            "sub_index": sub_index,
+            "local_path": storage_path,
+            "file_size": file_size,
+            "download_status": "COMPLETED",
+        }
+
+    async def _encode_image(self, image: DownloadedImage) -> List[Tuple[bytes, int]]:
+        if (
+            self.WEBP_PASSTHROUGH
+            and image.format == "WEBP"
+            and self.image_converter.is_passthrough_webp(
+                image.read(self.PASSTHROUGH_PROBE_BYTES),
+                self.WEBP_PASSTHROUGH_MAX_BPP,
+                image.size,
+            )
+        ):
+            await self.memory_budget.acquire(image.size, MemoryBudget.ENCODED)
+            return [(image.read(), image.size)]
 
-            await asyncio.sleep(self.DELAY_BETWEEN_IMAGES)
-            return {
-                "chapter_id": chapter_id,
-                "image_url": image_url,
-                "image_order": order,
-                "local_path": storage_path,
-                "file_size": file_size,
-                "download_status": "COMPLETED",
-            }
+        if self.TILE_TALL_IMAGES:
+            return await self.webp_encoder.encode_tiles(image.buffer, self.WEBP_QUALITY)
+        return [await self.webp_encoder.encode(image.buffer, self.WEBP_QUALITY)]
 
-        except Exception as e:
-            self.logger.error(f"Lỗi ảnh {order}: {e}")
+    async def _store_deduplicated(
+        self,
+        webp_data: bytes,
+        file_size: int,
+        source_hash: str,
+        filename: str,
+        series_title: str,
+        chapter_number: float,
+    ) -> Optional[Tuple[str, int]]:
+        """Lưu ảnh đã encode, dùng lại object cũ nếu trùng nội dung"""
+        encoded_hash = self.dedup_index.content_hash(webp_data)
+        stored = await self.dedup_index.lookup(encoded_hash)
+        if stored:
+            self.dedup_index.record("encoded")
+            await self.dedup_index.remember([source_hash], *stored)
+            return stored
+
+        self.dedup_index.record(None)
+        storage_path = await self._store_image(
+            webp_data, filename, series_title, chapter_number
+        )
+        if not storage_path:
             return None
 
+        await self.dedup_index.remember(
+            [source_hash, encoded_hash], storage_path, file_size
+        )
+        return storage_path, file_size
+
+    async def _store_image(
+        self,
+        webp_data: bytes,
+        filename: str,
+        series_title: str,
+        chapter_number: float,
+    ) -> Optional[str]:
+        """Upload lên R2 hoặc ghi ra đĩa, trả về đường dẫn lưu trong DB"""
+        if self.enable_r2 and self.r2_uploader:
+            # Create object key for R2
+            r2_object_key = (
+                StorageUtils.r2_chapter_prefix(series_title, chapter_number) + filename
+            )
+
+            return await self.r2_uploader.upload(webp_data, r2_object_key, "image/webp")
+
+        chapter_folder = await ExecutorRegistry.run(
+            "disk",
+            StorageUtils.create_directory_structure,
+            self.storage_path,
+            series_title,
+            chapter_number,
+        )
+        filepath = chapter_folder / filename
+        await ExecutorRegistry.run("disk", filepath.write_bytes, webp_data)
+        return str(StorageUtils.get_relative_path(self.storage_path, filepath))
+
+    def _chapter_concurrency(self) -> int:
+        """Số chapter song song đủ để lấp đầy limit hiện tại của CDN"""
+        return max(
+            self.MIN_CONCURRENT_CHAPTERS,
+            math.ceil(self.cdn_limiter.limit / self.IMAGES_PER_CHAPTER_SLOT),
+        )
+
     @staticmethod
     def parse_chapter_number(value: str):
         try:
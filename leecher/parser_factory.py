@@ -16,11 +16,13 @@ class ParserFactory:
         cls._logger.info(f"✅ Đăng ký: {source_name} -> {parser_class.__name__}")
 
     @classmethod
-    def create_parser(cls, source_name: str, session=None) -> BaseMangaParser:
+    def create_parser(
+        cls, source_name: str, session=None, client=None
+    ) -> BaseMangaParser:
         """Tạo parser instance"""
         if source_name not in cls._parsers:
             raise ValueError(f"Parser không tìm thấy: {source_name}")
-        return cls._parsers[source_name](session)
+        return cls._parsers[source_name](session, client)
 
     @classmethod
     def get_available_sources(cls) -> list:
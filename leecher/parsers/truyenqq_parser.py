@@ -1,8 +1,8 @@
+import hashlib
 import re
-from bs4 import BeautifulSoup
-from typing import List, Dict, Optional
+from datetime import datetime, timedelta, timezone
+from typing import AbstractSet, Any, List, Dict, Optional
 from leecher.base_parser import BaseMangaParser
-from concurrent.futures import ThreadPoolExecutor
 
 
 class TruyenQQParser(BaseMangaParser):
@@ -19,110 +19,181 @@ class TruyenQQParser(BaseMangaParser):
         "placeholder",
     ]
     IMAGE_PRIORITY_ATTRS = ["src", "data-cdn", "data-original", "data-src", "data-url"]
+    CHAPTER_ITEM_SELECTOR = ".works-chapter-list .works-chapter-item"
+    CHAPTER_LINK_SELECTOR = ".name-chap a"
+    PAGE_SELECTOR = ".page-chapter"
+    # Link chapter trong .name-chap: đủ để nhận ra danh sách có đổi hay không,
+    # bỏ qua cột thời gian và phần còn lại của trang
+    CHAPTER_LINK_PATTERN = re.compile(
+        r'class="[^"]*\bname-chap\b[^"]*"[^>]*>\s*<a\b[^>]*?href="([^"]*)"[^>]*>(.*?)</a>',
+        re.S,
+    )
+    PAGE_ORDER_PATTERN = re.compile(
+        r"(?:page_|/)(\d+)(?:\.(?:jpg|jpeg|png|webp))?", re.I
+    )
+    RECENT_UPDATES_PATH = "/truyen-moi-cap-nhat/trang-{page}.html"
+    RECENT_ITEM_SELECTOR = ".list_grid li"
+    RECENT_LINK_SELECTOR = ".book_name a"
+    RECENT_TIME_SELECTOR = ".time-ago"
+    SOURCE_TIMEZONE = timezone(timedelta(hours=7))
+    RELATIVE_TIME_PATTERN = re.compile(
+        r"(\d+)\s*(giây|phút|giờ|ngày|tuần|tháng|năm)\s*trước", re.I
+    )
+    ABSOLUTE_TIME_PATTERN = re.compile(
+        r"(?:(\d{1,2}):(\d{2})\s+)?(\d{1,2})/(\d{1,2})/(\d{4})"
+    )
+    RELATIVE_TIME_UNITS = {
+        "giây": timedelta(seconds=1),
+        "phút": timedelta(minutes=1),
+        "giờ": timedelta(hours=1),
+        "ngày": timedelta(days=1),
+        "tuần": timedelta(weeks=1),
+        "tháng": timedelta(days=30),
+        "năm": timedelta(days=365),
+    }
+
+    def parse_chapter_list(
+        self,
+        html: str,
+        series_url: str,
+        known_urls: Optional[AbstractSet[str]] = None,
+    ) -> List[Dict[str, str]]:
+        root = self.html.parse(html)
 
-    def __init__(self, session=None):
-        super().__init__(session)
-        self.session.headers.update({"Accept-Encoding": "gzip, deflate, br"})
-
-    def _decompress_response(self, response) -> str:
-        content = response.content
-        encoding = response.apparent_encoding or response.encoding or "utf-8"
-        return content.decode(encoding, errors="ignore")
-
-    def get_chapter_list(self, series_url: str) -> List[Dict[str, str]]:
-        try:
-            response = self.session.get(series_url, timeout=30)
-            response.raise_for_status()
-
-            html_text = self._decompress_response(response)
-            soup = BeautifulSoup(html_text, "html.parser")
-
-            chapters = self._extract_from_works_chapter_structure(soup, series_url)
-            chapters.reverse()
+        chapters = self._extract_from_works_chapter_structure(
+            root, series_url, known_urls or frozenset()
+        )
+        chapters.reverse()
 
-            self.logger.info(f"Đã trích xuất {len(chapters)} chapters")
-            return chapters
+        self.logger.info(f"Đã trích xuất {len(chapters)} chapters")
+        return chapters
 
-        except Exception as e:
-            self.logger.error(f"Lỗi khi lấy chapter list: {e}")
-            return []
+    def chapter_list_fingerprint(self, html: str) -> Optional[str]:
+        links = self.CHAPTER_LINK_PATTERN.findall(html)
+        if not links:
+            return None
+        digest = hashlib.sha256()
+        for href, text in links:
+            digest.update(f"{href}\t{self.clean_text(text)}\n".encode("utf-8"))
+        return digest.hexdigest()
 
     def _extract_from_works_chapter_structure(
-        self, soup: BeautifulSoup, base_url: str
+        self, root: Any, base_url: str, known_urls: AbstractSet[str]
     ) -> List[Dict[str, str]]:
-        chapter_items = soup.select(".works-chapter-list .works-chapter-item")
-        if not chapter_items:
-            return []
-
-        def process_item(item):
+        # Danh sách trên trang xếp mới nhất trước: gặp KNOWN_CHAPTER_RUN
+        # chapter đã biết liên tiếp thì phần còn lại đều cũ, khỏi xử lý tiếp.
+        # Chuỗi đã biết vẫn được trả về để phân biệt với trang không có chapter
+        chapters = []
+        known_run = 0
+        for item in self.html.select(root, self.CHAPTER_ITEM_SELECTOR):
             try:
-                name_chap = item.select_one(".name-chap a")
-                if not name_chap:
-                    return None
+                name_chap = self.html.select_one(item, self.CHAPTER_LINK_SELECTOR)
+                if name_chap is None:
+                    continue
 
-                chapter_url = name_chap.get("href")
-                chapter_text = self.clean_text(name_chap.get_text())
+                chapter_url = self.html.attr(name_chap, "href")
+                if not chapter_url:
+                    continue
 
-                if chapter_url:
-                    return {
-                        "url": self.normalize_url(chapter_url, base_url),
+                url = self.normalize_url(chapter_url, base_url)
+                known_run = known_run + 1 if url in known_urls else 0
+
+                chapter_text = self.clean_text(self.html.text(name_chap))
+                chapters.append(
+                    {
+                        "url": url,
                         "number": self.extract_chapter_number(chapter_text),
                         "title": chapter_text,
                     }
+                )
+                if known_run >= self.KNOWN_CHAPTER_RUN:
+                    self.logger.debug(
+                        f"Dừng sớm sau {len(chapters) - known_run} chapters mới"
+                    )
+                    break
 
             except Exception as e:
                 self.logger.warning(f"Lỗi xử lý works-chapter-item: {e}")
-                return None
 
-        with ThreadPoolExecutor(max_workers=min(8, len(chapter_items))) as executor:
-            results = list(executor.map(process_item, chapter_items))
-
-        return [r for r in results if r]
-
-    def get_image_urls(self, chapter_url: str) -> List[str]:
-        try:
-            response = self.session.get(chapter_url, timeout=30)
-            response.raise_for_status()
-
-            soup = BeautifulSoup(response.content, "html.parser")
-            image_urls = self._extract_from_page_chapter_structure(soup, chapter_url)
-            unique_urls = self._deduplicate_and_sort(image_urls)
+        return chapters
+
+    def parse_recent_updates(self, html: str, page_url: str) -> List[Dict[str, Any]]:
+        root = self.html.parse(html)
+        now = datetime.now(timezone.utc)
+
+        updates = []
+        for item in self.html.select(root, self.RECENT_ITEM_SELECTOR):
+            link = self.html.select_one(item, self.RECENT_LINK_SELECTOR)
+            href = self.html.attr(link, "href") if link is not None else None
+            if not href:
+                continue
+
+            time_node = self.html.select_one(item, self.RECENT_TIME_SELECTOR)
+            time_text = self.html.text(time_node) if time_node is not None else ""
+            updates.append(
+                {
+                    "url": self.normalize_url(href, page_url),
+                    "updated_at": self.parse_update_time(time_text, now),
+                }
+            )
+        return updates
+
+    def parse_update_time(self, text: str, now: datetime) -> Optional[datetime]:
+        """Đọc "2 giờ trước" hoặc "[HH:MM ]dd/mm/yyyy" (giờ Việt Nam).
+
+        Luôn làm tròn về phía muộn hơn để không dừng quét feed quá sớm.
+        """
+        text = self.clean_text(text).lower()
+        if match := self.RELATIVE_TIME_PATTERN.search(text):
+            amount, unit = match.groups()
+            return now - int(amount) * self.RELATIVE_TIME_UNITS[unit]
+
+        if match := self.ABSOLUTE_TIME_PATTERN.search(text):
+            hour, minute, day, month, year = match.groups()
+            try:
+                updated_at = datetime(
+                    int(year),
+                    int(month),
+                    int(day),
+                    int(hour or 0),
+                    int(minute or 0),
+                    tzinfo=self.SOURCE_TIMEZONE,
+                )
+            except ValueError:
+                return None
+            # Chỉ có ngày: lấy cuối ngày, thà kiểm tra thừa còn hơn bỏ sót
+            return updated_at if hour else updated_at + timedelta(days=1)
+        return None
 
-            self.logger.info(f"Tìm thấy {len(unique_urls)} ảnh hợp lệ")
-            return unique_urls
+    def parse_image_urls(self, html: str, chapter_url: str) -> List[str]:
+        root = self.html.parse(html)
+        image_urls = self._extract_from_page_chapter_structure(root, chapter_url)
+        unique_urls = self._deduplicate_and_sort(image_urls)
 
-        except Exception as e:
-            self.logger.error(f"Lỗi khi lấy image URLs: {e}")
-            return []
+        self.logger.info(f"Tìm thấy {len(unique_urls)} ảnh hợp lệ")
+        return unique_urls
 
     def _extract_from_page_chapter_structure(
-        self, soup: BeautifulSoup, base_url: str
+        self, root: Any, base_url: str
     ) -> List[str]:
-        page_chapters = soup.select(".page-chapter")
-        if not page_chapters:
-            return []
-
-        def process_page(page_div):
+        image_urls = []
+        for page_div in self.html.select(root, self.PAGE_SELECTOR):
             try:
-                img = page_div.find("img")
-                if not img:
-                    return None
+                img = self.html.select_one(page_div, "img")
+                if img is None:
+                    continue
 
                 src = self._extract_best_image_url(img)
                 if src:
-                    return self.normalize_url(src, base_url)
+                    image_urls.append(self.normalize_url(src, base_url))
             except Exception as e:
                 self.logger.warning(f"Lỗi xử lý page: {e}")
-                return None
-
-        with ThreadPoolExecutor(max_workers=min(8, len(page_chapters))) as executor:
-            results = list(executor.map(process_page, page_chapters))
 
-        return [r for r in results if r]
+        return image_urls
 
     def _extract_best_image_url(self, img_element) -> Optional[str]:
         for attr in self.IMAGE_PRIORITY_ATTRS:
-            src = img_element.get(attr)
+            src = self.html.attr(img_element, attr)
             if src and src.strip() and self.is_valid_image_url(src):
                 return src
         return None
@@ -164,6 +235,5 @@ class TruyenQQParser(BaseMangaParser):
             return image_urls
 
     def _extract_page_order(self, url: str) -> int:
-        pattern = re.compile(r"(?:page_|/)(\d+)(?:\.(?:jpg|jpeg|png|webp))?", re.I)
-        match = pattern.search(url)
+        match = self.PAGE_ORDER_PATTERN.search(url)
         return int(match.group(1)) if match else 9999
@@ -0,0 +1,71 @@
+import asyncio
+from typing import Dict, List, Optional, Set
+
+from leecher.base_parser import BaseMangaParser
+from shared.logger import logging
+
+
+class ImageListPrefetcher:
+    """Lấy trước danh sách ảnh của K chapter kế tiếp trong nền.
+
+    Chapter page được tải và parse trong lúc chapter hiện tại đang tải ảnh,
+    nên khi chapter kế tiếp có slot thì danh sách ảnh đã sẵn sàng. Số kết
+    quả lấy trước nhưng chưa dùng tối đa là lookahead; request vẫn đi qua
+    session của parser nên tuân theo rate limit của source.
+    """
+
+    def __init__(
+        self, parser: BaseMangaParser, chapter_urls: List[str], lookahead: int
+    ):
+        self.parser = parser
+        self.chapter_urls = chapter_urls
+        self.logger = logging.getLogger(__name__)
+        self._slots = asyncio.Semaphore(max(1, lookahead))
+        self._pending: Dict[str, asyncio.Task] = {}
+        self._claimed: Set[str] = set()
+        self._runner: Optional[asyncio.Task] = None
+
+    def start(self) -> "ImageListPrefetcher":
+        if self._runner is None:
+            self._runner = asyncio.create_task(self._run())
+        return self
+
+    async def _run(self) -> None:
+        for url in self.chapter_urls:
+            await self._slots.acquire()
+            if url in self._claimed:
+                self._slots.release()
+                continue
+            self._pending[url] = asyncio.create_task(self.parser.aget_image_urls(url))
+
+    async def get(self, chapter_url: str) -> List[str]:
+        """Lấy danh sách ảnh: dùng kết quả prefetch nếu có, không thì tải ngay"""
+        self._claimed.add(chapter_url)
+        task = self._pending.pop(chapter_url, None)
+        if task is None:
+            return await self.parser.aget_image_urls(chapter_url)
+
+        try:
+            return await task
+        finally:
+            self._slots.release()
+
+    def discard(self, chapter_url: str) -> None:
+        """Bỏ chapter không cần tải nữa để nhả slot cho chapter sau"""
+        self._claimed.add(chapter_url)
+        task = self._pending.pop(chapter_url, None)
+        if task is not None:
+            task.cancel()
+            self._slots.release()
+
+    async def aclose(self) -> None:
+        if self._runner is not None:
+            self._runner.cancel()
+        for task in self._pending.values():
+            task.cancel()
+        await asyncio.gather(
+            *([self._runner] if self._runner else []),
+            *self._pending.values(),
+            return_exceptions=True,
+        )
+        self._pending.clear()
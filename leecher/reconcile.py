@@ -0,0 +1,102 @@
+"""Khôi phục ChapterImage từ object đã có trên R2.
+
+Dùng khi DB mất record của ảnh đã upload (crash giữa chừng, chapter
+PARTIAL/FAILED): list prefix của series một lần rồi ghi bù record theo lô.
+
+    python -m leecher.reconcile            # mọi series ACTIVE
+    python -m leecher.reconcile 12 34      # chỉ các series chỉ định
+"""
+
+import argparse
+import asyncio
+import re
+from typing import List
+
+from database.leech_manager import LeecheDatabaseManager
+from shared.executors import ExecutorRegistry
+from shared.logger import logging
+from shared.r2_manifest import R2Manifest
+from shared.r2_storage import R2Storage
+from shared.storage_utils import StorageUtils
+
+logger = logging.getLogger(__name__)
+
+# Chỉ ảnh đơn "001.webp"; tile "001_00.webp" có thể chỉ upload được một phần
+IMAGE_KEY_PATTERN = re.compile(r"(\d{3})\.webp$")
+
+
+async def reconcile_series(db: LeecheDatabaseManager, manifest: R2Manifest, series):
+    """Ghi bù record cho các chapter chưa COMPLETED của series, trả về số record"""
+    chapters = await db.get_pending_chapters(series.id)
+    if not chapters:
+        return 0
+
+    await manifest.load(StorageUtils.r2_series_prefix(series.title))
+
+    records = []
+    for chapter in chapters:
+        prefix = StorageUtils.r2_chapter_prefix(series.title, chapter.chapter_number)
+        for object_key, (file_size, _) in (await manifest.folder(prefix)).items():
+            match = IMAGE_KEY_PATTERN.fullmatch(object_key[len(prefix) :])
+            if not match:
+                continue
+            public_url = manifest.storage.get_public_url(object_key)
+            records.append(
+                {
+                    "chapter_id": chapter.id,
+                    # URL gốc không còn, dùng URL của object trên R2
+                    "image_url": public_url,
+                    "image_order": int(match.group(1)),
+                    "sub_index": 0,
+                    "local_path": public_url,
+                    "file_size": file_size,
+                    "download_status": "COMPLETED",
+                }
+            )
+
+    inserted = await db.bulk_add_chapter_images(records, skip_duplicates=True)
+    logger.info(
+        f"🔧 {series.title}: {inserted}/{len(records)} ảnh được khôi phục "
+        f"({len(chapters)} chapters)"
+    )
+    return inserted
+
+
+async def main(series_ids: List[int]):
+    db = LeecheDatabaseManager()
+    if not await db.connect():
+        return
+
+    ExecutorRegistry.acquire()
+    manifest = R2Manifest(
+        R2Storage(max_pool_connections=ExecutorRegistry.size("storage"))
+    )
+    total = 0
+    try:
+        if series_ids:
+            series_list = [await db.get_series_by_id(i) for i in series_ids]
+        else:
+            series_list = await db.get_active_series()
+
+        for series in series_list:
+            if not series:
+                continue
+            try:
+                total += await reconcile_series(db, manifest, series)
+            except Exception as e:
+                logger.error(f"❌ Lỗi reconcile series {series.id}: {e}")
+            finally:
+                # Xong series thì bỏ cache để manifest không lớn dần
+                manifest.evict(StorageUtils.r2_series_prefix(series.title))
+
+        logger.info(f"✅ Đã khôi phục {total} ảnh")
+    finally:
+        await db.disconnect()
+        await ExecutorRegistry.release()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Khôi phục ChapterImage từ R2")
+    parser.add_argument("series_ids", nargs="*", type=int)
+    args = parser.parse_args()
+    asyncio.run(main(args.series_ids))
@@ -1,16 +1,59 @@
 import asyncio
 import logging
+import os
 import signal
+import socket
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Optional, Set, Tuple
+from urllib.parse import urlparse
 
-from aiolimiter import AsyncLimiter
+from leecher.check_schedule import CheckPolicy, CheckSchedule
 from leecher.manga_leecher import MangaLeecher
 from leecher import ParserFactory
+from shared.dedup_index import DedupIndex
+from shared.metrics import Metrics
+from shared.rate_limiter import SharedRateLimitTable
 
 
 class MangaLeechService:
-    def __init__(self, db_manager):
+    SERIES_CONCURRENCY = 3
+    # Lease hết hạn sau khoảng này nếu node không gửi heartbeat
+    LEASE_SECONDS = 300
+    # Series vừa xử lý xong không bị claim lại (bởi bất kỳ node nào) ngay
+    RECHECK_COOLDOWN_SECONDS = 3600
+    # Series xử lý lỗi chờ lâu hơn trước khi được thử lại
+    FAILURE_COOLDOWN_SECONDS = 6 * 3600
+    # Feed mới cập nhật được quét lùi tới lần quét trước (chồng lên một
+    # đoạn), tối đa DISCOVERY_WINDOW_SECONDS
+    DISCOVERY_WINDOW_SECONDS = 86400
+    DISCOVERY_OVERLAP_SECONDS = 600
+    # Source có feed: series không xuất hiện trong feed vẫn được kiểm tra
+    # lại sau ngần này ngày phòng khi feed bỏ sót
+    FEED_RECHECK_DAYS = 7
+    # Chế độ daemon: quét feed và nạp lại lịch từ DB sau mỗi khoảng này,
+    # giữa các lần đó ngủ tới hạn kiểm tra gần nhất
+    DAEMON_REFRESH_SECONDS = 1800
+    DAEMON_MIN_SLEEP_SECONDS = 5
+
+    def __init__(
+        self,
+        db_manager,
+        shard: Tuple[int, int] = (0, 1),
+        rate_limit_table: Optional[SharedRateLimitTable] = None,
+    ):
         self.db = db_manager
-        self.leecher = MangaLeecher(self.db, enable_r2=True)
+        # (index, count): chỉ xử lý series có id % count == index
+        self.shard = shard
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._leased_series: Set[int] = set()
+        # Series đã xử lý (thành công hay lỗi) trong lượt chạy hiện tại
+        self._released_series: Set[int] = set()
+        self._processed_count = 0
+        self._schedule = CheckSchedule()
+        self.leecher = MangaLeecher(
+            self.db, enable_r2=True, rate_limit_table=rate_limit_table
+        )
         self.logger = logging.getLogger(__name__)
         self._stop_event = asyncio.Event()
         self._register_parsers()
@@ -30,15 +73,12 @@ class MangaLeechService:
             self.logger.error(f"Lỗi đăng ký parser: {e}")
 
     async def start(self):
-        if not await self.db.connect():
-            self.logger.error("Kết nối database thất bại")
+        """Một lượt: xử lý hết các series đang tới hạn rồi dừng"""
+        if not await self._open():
             return
 
-        reset_count = await self.db.reset_stuck_downloads()
-        if reset_count > 0:
-            self.logger.info(f"Reset {reset_count} chapters đang download dở")
-
         try:
+            await self._discover_updates()
             await self._process_pending_series()
 
         except KeyboardInterrupt:
@@ -46,48 +86,286 @@ class MangaLeechService:
         except Exception as e:
             self.logger.error(f"Lỗi service: {e}")
         finally:
-            await self.db.disconnect()
-            self.logger.info("Đã chạy xong và dừng dịch vụ.")
+            await self._close()
 
-    async def _process_pending_series(self):
+    async def run_daemon(self):
+        """Chạy liên tục, mỗi series được kiểm tra khi tới next_check_at.
+
+        Hạn kiểm tra của các series nằm trong một heap; service ngủ tới hạn
+        gần nhất rồi chạy một lượt claim, thay vì quét cả catalogue vào vài
+        giờ cố định. Các lượt chạy tuần tự trong một vòng lặp nên không bao
+        giờ chồng lên nhau.
+        """
+        if not await self._open():
+            return
+
+        loop = asyncio.get_running_loop()
         try:
-            pending_series = await self.db.get_pending_series()
-            if not pending_series:
-                return
+            next_refresh = loop.time()
+            while not self._stop_event.is_set():
+                run_pass = bool(self._schedule.pop_due(datetime.now(timezone.utc)))
+                if loop.time() >= next_refresh:
+                    await self._discover_updates()
+                    self._schedule.rebuild(
+                        await self.db.get_check_schedule(
+                            self.DAEMON_REFRESH_SECONDS, self.shard
+                        )
+                    )
+                    self._schedule.pop_due(datetime.now(timezone.utc))
+                    next_refresh = loop.time() + self.DAEMON_REFRESH_SECONDS
+                    # Luôn chạy sau khi quét feed để lấy các series feed báo đổi
+                    run_pass = True
+
+                if run_pass:
+                    await self._process_pending_series()
+
+                await self._sleep_until_due(next_refresh - loop.time())
+
+        except KeyboardInterrupt:
+            self.logger.info("Service dừng bởi người dùng")
+        except Exception as e:
+            self.logger.error(f"Lỗi service: {e}")
+        finally:
+            await self._close()
+
+    async def _sleep_until_due(self, max_seconds: float) -> None:
+        seconds = max_seconds
+        next_due = self._schedule.next_due()
+        if next_due is not None:
+            seconds = min(
+                seconds, (next_due - datetime.now(timezone.utc)).total_seconds()
+            )
+        seconds = max(self.DAEMON_MIN_SLEEP_SECONDS, seconds)
+        try:
+            await asyncio.wait_for(self._stop_event.wait(), timeout=seconds)
+        except asyncio.TimeoutError:
+            pass
+
+    async def _open(self) -> bool:
+        Metrics.reset()
+        # Gauge do MemoryBudget ghi lúc khởi tạo đã bị reset xóa
+        self.leecher.memory_budget.export()
+        if not await self.db.connect():
+            self.logger.error("Kết nối database thất bại")
+            return False
+
+        reset_count = await self.db.reset_stuck_downloads()
+        if reset_count > 0:
+            self.logger.info(f"Reset {reset_count} chapters đang download dở")
+        return True
 
-            self.logger.info(f"Xử lý {len(pending_series)} series")
-
-            rate_limiter = AsyncLimiter(max_rate=1, time_period=3)
-            semaphore = asyncio.Semaphore(3)
-
-            async def process_one(series):
-                if self._stop_event.is_set():
-                    return
-
-                if series.source.name not in ParserFactory.get_available_sources():
-                    self.logger.error(f"Source không hỗ trợ: {series.source.name}")
-                    return
-
-                try:
-                    async with rate_limiter:
-                        async with semaphore:
-                            if self._stop_event.is_set():
-                                return
-                            success = await self.leecher.download_series(series.id)
-                            level = self.logger.info if success else self.logger.error
-                            level(f"{'✅' if success else '❌'} {series.title}")
-                except asyncio.CancelledError:
-                    self.logger.info(f"❌ {series.title} bị dừng giữa chừng")
-                    return
-
-            self._tasks = [
-                asyncio.create_task(process_one(series)) for series in pending_series
+    async def _close(self) -> None:
+        self._log_run_stats()
+        await self.leecher.close()
+        await self.db.disconnect()
+        self.logger.info("Đã chạy xong và dừng dịch vụ.")
+
+    async def _discover_updates(self):
+        """Quét feed mới cập nhật của các source, đánh dấu series có thay đổi.
+
+        Source quét hết được feed thì chỉ các series có trong feed (và
+        series lâu chưa kiểm tra) được claim, thay vì tải trang từng series.
+        """
+        now = datetime.now(timezone.utc)
+        for source in await self.db.get_active_sources():
+            if source.name not in ParserFactory.get_available_sources():
+                continue
+            try:
+                await self._discover_source_updates(source, now)
+            except Exception as e:
+                self.logger.error(f"Lỗi quét feed {source.name}: {e}")
+
+    async def _discover_source_updates(self, source, now: datetime):
+        parser = ParserFactory.create_parser(
+            source.name, client=self.leecher.get_session_for_source(source.name)
+        )
+        if not parser.supports_recent_updates:
+            return
+
+        self.leecher.rate_limiters.configure_source(
+            source.name,
+            source.rate_limit_per_minute,
+            urlparse(source.base_url).hostname,
+        )
+        since = now - timedelta(seconds=self.DISCOVERY_WINDOW_SECONDS)
+        if source.feed_checked_at:
+            since = max(
+                since,
+                source.feed_checked_at
+                - timedelta(seconds=self.DISCOVERY_OVERLAP_SECONDS),
+            )
+
+        updates = await parser.aget_recent_updates(source.base_url, since)
+        if updates is None:
+            return
+
+        # Một series có thể xuất hiện nhiều lần; giữ thời điểm mới nhất
+        latest: Dict[str, datetime] = {}
+        for item in updates:
+            path = urlparse(item["url"]).path
+            updated_at = item["updated_at"] or now
+            latest[path] = max(latest.get(path, updated_at), updated_at)
+
+        marked = await self.db.mark_series_updated(source.id, latest)
+        if marked is None:
+            return
+        await self.db.set_feed_checked(source.id, now)
+        Metrics.inc("discovery.marked", marked)
+        self.logger.info(
+            f"📰 {source.name}: {len(latest)} series trong feed, "
+            f"{marked} series đang theo dõi cần kiểm tra"
+        )
+
+    async def _process_pending_series(self):
+        """Các worker lần lượt claim series qua lease trong DB cho tới khi hết.
+
+        Nhiều node chạy cùng lúc chia nhau danh sách series thay vì xử lý
+        trùng; lease được gia hạn định kỳ, node chết thì lease hết hạn và
+        series được node khác claim lại. Mỗi series được xử lý tối đa một lần
+        trong một lượt, kể cả khi lượt chạy lâu hơn cooldown.
+        """
+        self._released_series.clear()
+        try:
+            workers = [
+                asyncio.create_task(self._series_worker())
+                for _ in range(self.SERIES_CONCURRENCY)
             ]
-            await asyncio.gather(*self._tasks, return_exceptions=True)
+            heartbeat = asyncio.create_task(self._heartbeat_loop())
+            self._tasks = workers + [heartbeat]
+            try:
+                await asyncio.gather(*workers, return_exceptions=True)
+            finally:
+                heartbeat.cancel()
+
+            self.logger.info(f"Đã xử lý {self._processed_count} series")
 
         except Exception as e:
             self.logger.error(f"Lỗi xử lý series: {e}")
 
+    async def _series_worker(self):
+        while not self._stop_event.is_set():
+            claimed = await self.db.claim_series(
+                self.worker_id,
+                self.LEASE_SECONDS,
+                shard=self.shard,
+                feed_recheck_days=self.FEED_RECHECK_DAYS,
+                exclude_ids=self._released_series,
+            )
+            if not claimed:
+                return
+
+            series = claimed[0]
+            self._leased_series.add(series.id)
+            # Lỗi thì chờ FAILURE_COOLDOWN_SECONDS; bị dừng giữa chừng thì trả
+            # lease không cooldown để node khác làm tiếp
+            cooldown = self.FAILURE_COOLDOWN_SECONDS
+            success = False
+            next_check_at = None
+            try:
+                success = await self._process_series(series)
+                if success:
+                    cooldown = self.RECHECK_COOLDOWN_SECONDS
+                    next_check_at = await self._next_check_at(series)
+            except asyncio.CancelledError:
+                cooldown = 0
+                self.logger.info(f"❌ {series.title} bị dừng giữa chừng")
+                return
+            except Exception as e:
+                self.logger.error(f"Lỗi xử lý series {series.title}: {e}")
+            finally:
+                self._leased_series.discard(series.id)
+                self._released_series.add(series.id)
+                await self.db.release_series_lease(
+                    series.id,
+                    self.worker_id,
+                    cooldown,
+                    checked=success,
+                    next_check_at=next_check_at,
+                )
+                if next_check_at is not None:
+                    # Trong cooldown series chưa claim lại được
+                    cooldown_until = datetime.now(timezone.utc) + timedelta(
+                        seconds=cooldown
+                    )
+                    self._schedule.push(series.id, max(next_check_at, cooldown_until))
+
+    async def _process_series(self, series) -> bool:
+        if series.source.name not in ParserFactory.get_available_sources():
+            self.logger.error(f"Source không hỗ trợ: {series.source.name}")
+            return False
+
+        self._processed_count += 1
+        success = await self.leecher.download_series(series.id)
+        level = self.logger.info if success else self.logger.error
+        level(f"{'✅' if success else '❌'} {series.title}")
+        return success
+
+    async def _next_check_at(self, series) -> datetime:
+        """Lần kiểm tra tiếp theo theo nhịp ra chapter của series"""
+        release_times = await self.db.get_release_times(
+            series.id, CheckPolicy.RELEASE_HISTORY
+        )
+        return CheckPolicy.next_check_at(
+            series.status, release_times, datetime.now(timezone.utc)
+        )
+
+    async def _heartbeat_loop(self):
+        while True:
+            await asyncio.sleep(self.LEASE_SECONDS / 3)
+            held = list(self._leased_series)
+            renewed = await self.db.renew_series_leases(
+                held, self.worker_id, self.LEASE_SECONDS
+            )
+            if renewed < len(held):
+                self.logger.warning(
+                    f"⚠️ Chỉ gia hạn được {renewed}/{len(held)} lease, "
+                    "có thể đã bị node khác claim lại"
+                )
+
+    def _log_run_stats(self):
+        limits = {
+            name: Metrics.get(f"concurrency.{name}.limit")
+            for name in ("cdn", "r2", "chapters")
+        }
+        self.logger.info(f"⚙️ Concurrency limits: {limits}")
+
+        stalls = {
+            stage: (
+                round(Metrics.get(f"pipeline.images.{stage}.idle_seconds"), 1),
+                round(Metrics.get(f"pipeline.images.{stage}.blocked_seconds"), 1),
+            )
+            for stage in ("fetch", "encode", "upload", "record")
+        }
+        self.logger.info(f"⏱️ Pipeline stall (idle, blocked) giây: {stalls}")
+
+        executors = {
+            name: Metrics.get(f"executor.{name}.max_workers")
+            for name in ("network", "cpu", "storage", "disk", "encode")
+        }
+        self.logger.info(f"🧵 Executor workers: {executors}")
+
+        self.logger.info(
+            f"📥 Download: {Metrics.get('download.bytes') / 1024 / 1024:.1f} MB, "
+            f"bị từ chối={Metrics.get('download.rejected')}, "
+            f"spill ra đĩa={Metrics.get('download.spilled')}"
+        )
+
+        self.logger.info(
+            f"🧠 Memory budget: {Metrics.get('memory.budget.limit') / 1024 / 1024:.0f} MB, "
+            f"chờ {Metrics.get('memory.budget.waits')} lần "
+            f"({Metrics.get('memory.budget.wait_seconds'):.1f}s)"
+        )
+
+        images = Metrics.get("dedup.images")
+        if images:
+            self.logger.info(
+                f"♻️ Dedup (cộng dồn từ lúc mở service): "
+                f"{Metrics.get('dedup.hits')}/{images} ảnh trùng "
+                f"({DedupIndex.hit_rate():.1%}), "
+                f"source={Metrics.get('dedup.source_hits')}, "
+                f"encoded={Metrics.get('dedup.encoded_hits')}"
+            )
+
     def stop(self):
         self.logger.info("Đang dừng service ngay lập tức...")
         self._stop_event.set()
@@ -2,6 +2,8 @@ import asyncio
 from datetime import datetime
 import logging
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
+from apscheduler.triggers.combining import OrTrigger
+from apscheduler.triggers.cron import CronTrigger
 from database.leech_manager import LeecheDatabaseManager
 from leecher.service import MangaLeechService
 from shared.logger import logging
@@ -19,8 +21,14 @@ async def run_manga_service():
 async def main():
     scheduler = AsyncIOScheduler()
 
-    scheduler.add_job(run_manga_service, "cron", hour=0, minute=0)
-    scheduler.add_job(run_manga_service, "cron", hour=20, minute=15)
+    # Một job cho cả hai mốc giờ: max_instances=1 để lượt sau không chạy
+    # chồng lên lượt trước còn chưa xong, coalesce gộp các lượt bị lỡ
+    scheduler.add_job(
+        run_manga_service,
+        OrTrigger([CronTrigger(hour=0, minute=0), CronTrigger(hour=20, minute=15)]),
+        max_instances=1,
+        coalesce=True,
+    )
 
     scheduler.start()
 
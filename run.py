@@ -7,12 +7,12 @@ from shared.logger import logging
 
 async def main():
     logger = logging.getLogger(__name__)
-    logger.info("🚀 Starting Manga Leech Service...")
+    logger.info("🚀 Starting Manga Leech Service (daemon)...")
 
-    service = MangaLeechService(db_manager=LeecheDatabaseManager(), check_interval=30)
+    service = MangaLeechService(db_manager=LeecheDatabaseManager())
 
     try:
-        await service.start()
+        await service.run_daemon()
     except Exception as e:
         logger.error(f"❌ Service error: {e}")
 
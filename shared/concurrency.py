@@ -0,0 +1,179 @@
+import asyncio
+import math
+import time
+from contextlib import asynccontextmanager
+from typing import Optional
+
+from shared.metrics import Metrics
+
+
+class SlotOutcome:
+    """Kết quả của một slot do caller tự phân loại.
+
+    failed = None: suy ra từ việc khối lệnh có raise hay không. Caller đặt
+    True/False khi biết rõ hơn, vd. response 404 không phải lỗi do quá tải
+    dù sau đó caller raise vì không dùng được response.
+    """
+
+    def __init__(self):
+        self.failed: Optional[bool] = None
+
+
+class ConcurrencyLimiter:
+    """Semaphore có thể đổi giới hạn khi đang chạy, export limit/in-flight"""
+
+    def __init__(self, name: str, limit: int):
+        self.name = name
+        self.limit = float(limit)
+        self.in_flight = 0
+        self._cond = asyncio.Condition()
+        self._export()
+
+    async def set_limit(self, limit: int) -> None:
+        async with self._cond:
+            self.limit = float(limit)
+            self._export()
+            # Limit tăng thì các task đang chờ slot phải được đánh thức
+            self._cond.notify_all()
+
+    @asynccontextmanager
+    async def slot(self):
+        async with self._cond:
+            await self._cond.wait_for(lambda: self.in_flight < int(self.limit))
+            self.in_flight += 1
+            self._export()
+
+        started_at = time.monotonic()
+        outcome = SlotOutcome()
+        succeeded = False
+        try:
+            yield outcome
+            succeeded = True
+        finally:
+            if outcome.failed is not None:
+                succeeded = not outcome.failed
+            async with self._cond:
+                self.in_flight -= 1
+                self._on_complete(time.monotonic() - started_at, succeeded)
+                self._export()
+                self._cond.notify_all()
+
+    def _on_complete(self, latency: float, succeeded: bool) -> None:
+        pass
+
+    def _export(self) -> None:
+        Metrics.set_gauge(f"concurrency.{self.name}.limit", int(self.limit))
+        Metrics.set_gauge(f"concurrency.{self.name}.in_flight", self.in_flight)
+
+
+class AdaptiveConcurrencyLimiter(ConcurrencyLimiter):
+    """Giới hạn in-flight tự điều chỉnh theo gradient độ trễ.
+
+    So sánh độ trễ ngắn hạn (EWMA) với độ trễ nền (min trong cửa sổ gần
+    nhất): khi độ trễ tăng vì hàng đợi phía server dài ra thì giảm limit,
+    khi còn trong ngưỡng chịu đựng thì tăng thêm khoảng sqrt(limit). Nhờ
+    vậy limit đứng quanh điểm gãy của đường cong throughput/latency.
+    Throughput được theo dõi riêng để export.
+    """
+
+    SHORT_SMOOTHING = 0.3
+    LIMIT_SMOOTHING = 0.5
+    RTT_TOLERANCE = 1.5
+    MIN_GRADIENT = 0.5
+    FAILURE_BACKOFF = 0.9
+    BASELINE_WINDOW = 300.0
+    UPDATE_INTERVAL = 1.0
+    MIN_UPDATE_SAMPLES = 10
+    THROUGHPUT_WINDOW = 10.0
+
+    def __init__(
+        self,
+        name: str,
+        initial_limit: int,
+        min_limit: int = 2,
+        max_limit: int = 200,
+    ):
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.short_rtt: Optional[float] = None
+        self.baseline_rtt: Optional[float] = None
+        self.throughput = 0.0
+        self._samples_total = 0.0
+        self._samples_count = 0
+        self._samples_started_at = time.monotonic()
+        self._window_min_rtt = math.inf
+        self._window_started_at = time.monotonic()
+        self._throughput_started_at = time.monotonic()
+        self._throughput_completed = 0
+        super().__init__(name, initial_limit)
+
+    def _on_complete(self, latency: float, succeeded: bool) -> None:
+        self._track_throughput()
+
+        if not succeeded:
+            self.limit = max(self.min_limit, self.limit * self.FAILURE_BACKOFF)
+            return
+
+        self._track_baseline(latency)
+
+        # Gom mẫu theo cửa sổ thời gian rồi mới cập nhật limit một lần, để
+        # các request bắt đầu trước lần đổi limit không kéo limit dao động
+        self._samples_total += latency
+        self._samples_count += 1
+        if (
+            self._samples_count < self.MIN_UPDATE_SAMPLES
+            or time.monotonic() - self._samples_started_at < self.UPDATE_INTERVAL
+        ):
+            return
+
+        window_rtt = self._samples_total / self._samples_count
+        self._samples_total = 0.0
+        self._samples_count = 0
+        self._samples_started_at = time.monotonic()
+
+        if self.short_rtt is None:
+            self.short_rtt = window_rtt
+        self.short_rtt += (window_rtt - self.short_rtt) * self.SHORT_SMOOTHING
+
+        gradient = max(
+            self.MIN_GRADIENT,
+            min(1.0, self.RTT_TOLERANCE * self.baseline_rtt / self.short_rtt),
+        )
+        # Chỉ tăng khi limit thực sự đang được dùng; giảm thì luôn áp dụng
+        if gradient >= 1.0 and self.in_flight < self.limit / 2:
+            return
+        new_limit = self.limit * gradient + math.sqrt(self.limit)
+        self.limit = min(
+            self.max_limit,
+            max(
+                self.min_limit,
+                self.limit * (1 - self.LIMIT_SMOOTHING)
+                + new_limit * self.LIMIT_SMOOTHING,
+            ),
+        )
+
+    def _track_baseline(self, latency: float) -> None:
+        # Độ trễ nền = min của cửa sổ trước (BASELINE_WINDOW giây), làm mới
+        # định kỳ để không bị kẹt ở một mẫu quá nhanh khi mạng/origin đổi
+        self._window_min_rtt = min(self._window_min_rtt, latency)
+        if self.baseline_rtt is None:
+            self.baseline_rtt = latency
+        self.baseline_rtt = min(self.baseline_rtt, latency)
+        if time.monotonic() - self._window_started_at >= self.BASELINE_WINDOW:
+            self.baseline_rtt = self._window_min_rtt
+            self._window_min_rtt = math.inf
+            self._window_started_at = time.monotonic()
+
+    def _track_throughput(self) -> None:
+        self._throughput_completed += 1
+        elapsed = time.monotonic() - self._throughput_started_at
+        if elapsed >= self.THROUGHPUT_WINDOW:
+            self.throughput = self._throughput_completed / elapsed
+            self._throughput_started_at = time.monotonic()
+            self._throughput_completed = 0
+
+    def _export(self) -> None:
+        super()._export()
+        Metrics.set_gauge(f"concurrency.{self.name}.throughput", self.throughput)
+        if self.short_rtt is not None:
+            Metrics.set_gauge(f"concurrency.{self.name}.latency", self.short_rtt)
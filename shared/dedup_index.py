@@ -0,0 +1,145 @@
+import hashlib
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Callable, Iterable, Optional, Tuple
+
+from shared.executors import ExecutorRegistry
+from shared.logger import logging
+from shared.metrics import Metrics
+
+
+class DedupIndex:
+    """Index content-hash -> object đã lưu, dùng chung giữa chapter và series.
+
+    Tầng 1 là file SQLite cục bộ (tra cứu nhanh, còn lại sau khi restart),
+    tầng 2 là bảng image_blobs trong DB để các node khác dùng lại. Key gồm
+    namespace (r2/local) để không trộn đường dẫn của hai backend lưu trữ.
+
+    File SQLite dùng chung giữa các worker process và được truy cập trên
+    executor "disk" (không chặn event loop). Tầng cục bộ chỉ là cache:
+    lỗi SQLite (vd. database is locked) được log và bỏ qua.
+    """
+
+    DB_FILENAME = ".dedup.sqlite"
+    # Chờ khóa ghi của process khác tối đa bấy nhiêu giây
+    LOCK_TIMEOUT_SECONDS = 5.0
+
+    def __init__(self, db_manager, storage_path: Path, namespace: str):
+        self.db = db_manager
+        self.namespace = namespace
+        self.logger = logging.getLogger(__name__)
+        self.path = storage_path / self.DB_FILENAME
+        # Mở lúc dùng lần đầu trên executor; lock tuần tự hóa các thread
+        self.conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(
+            self.path, timeout=self.LOCK_TIMEOUT_SECONDS, check_same_thread=False
+        )
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS blobs ("
+                "hash TEXT PRIMARY KEY, storage_path TEXT NOT NULL, file_size INTEGER)"
+            )
+            conn.commit()
+        except sqlite3.Error:
+            conn.close()
+            raise
+        return conn
+
+    def _execute(self, fn: Callable, *args):
+        with self._lock:
+            if self.conn is None:
+                self.conn = self._connect()
+            return fn(self.conn, *args)
+
+    async def _run_local(self, fn: Callable, *args):
+        """Chạy fn(conn, *args) trên executor "disk"; lỗi SQLite trả về None"""
+        try:
+            return await ExecutorRegistry.run("disk", self._execute, fn, *args)
+        except sqlite3.Error as e:
+            self.logger.warning(f"⚠️ Dedup index cục bộ lỗi, bỏ qua: {e}")
+            return None
+
+    def content_hash(self, data: bytes) -> str:
+        return self.hash_key(hashlib.sha256(data).hexdigest())
+
+    def hash_key(self, sha256_hex: str) -> str:
+        """Key từ SHA-256 đã tính sẵn (vd. tính dần trong lúc stream)"""
+        return f"{self.namespace}:{sha256_hex}"
+
+    async def lookup(self, content_hash: str) -> Optional[Tuple[str, int]]:
+        """Trả về (storage_path, file_size) nếu nội dung đã được lưu"""
+        row = await self._run_local(self._select_local, content_hash)
+        if row:
+            return row[0], row[1]
+
+        blob = await self.db.get_image_blob(content_hash)
+        if not blob:
+            return None
+
+        await self._run_local(
+            self._insert_local, [content_hash], blob.storage_path, blob.file_size
+        )
+        return blob.storage_path, blob.file_size
+
+    async def remember(
+        self, hashes: Iterable[str], storage_path: str, file_size: int
+    ) -> None:
+        hashes = list(hashes)
+        await self._run_local(self._insert_local, hashes, storage_path, file_size)
+        await self.db.add_image_blobs(
+            [
+                {"hash": h, "storage_path": storage_path, "file_size": file_size}
+                for h in hashes
+            ]
+        )
+
+    @staticmethod
+    def _select_local(
+        conn: sqlite3.Connection, content_hash: str
+    ) -> Optional[Tuple[str, int]]:
+        return conn.execute(
+            "SELECT storage_path, file_size FROM blobs WHERE hash = ?",
+            (content_hash,),
+        ).fetchone()
+
+    @staticmethod
+    def _insert_local(
+        conn: sqlite3.Connection,
+        hashes: Iterable[str],
+        storage_path: str,
+        file_size: int,
+    ) -> None:
+        try:
+            conn.executemany(
+                "INSERT OR IGNORE INTO blobs (hash, storage_path, file_size) "
+                "VALUES (?, ?, ?)",
+                [(h, storage_path, file_size) for h in hashes],
+            )
+            conn.commit()
+        except sqlite3.Error:
+            conn.rollback()
+            raise
+
+    @staticmethod
+    def record(hit_kind: Optional[str]) -> None:
+        """Đếm một ảnh đã tra cứu; hit_kind là "source", "encoded" hoặc None"""
+        Metrics.inc("dedup.images")
+        if hit_kind:
+            Metrics.inc("dedup.hits")
+            Metrics.inc(f"dedup.{hit_kind}_hits")
+
+    @staticmethod
+    def hit_rate() -> float:
+        return Metrics.ratio("dedup.hits", "dedup.images")
+
+    def close(self) -> None:
+        with self._lock:
+            if self.conn is not None:
+                self.conn.close()
+                self.conn = None
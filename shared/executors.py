@@ -0,0 +1,119 @@
+import asyncio
+import functools
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List
+
+from shared.metrics import Metrics
+
+
+class InstrumentedThreadPool(ThreadPoolExecutor):
+    """ThreadPoolExecutor đếm số job đang chờ và số worker đang bận"""
+
+    def __init__(self, name: str, max_workers: int):
+        super().__init__(max_workers=max_workers, thread_name_prefix=name)
+        self.name = name
+        self.queued = 0
+        self.busy = 0
+        self._stats_lock = threading.Lock()
+        Metrics.set_gauge(f"executor.{name}.max_workers", max_workers)
+        self._export()
+
+    def submit(self, fn: Callable, /, *args, **kwargs):
+        with self._stats_lock:
+            self.queued += 1
+            self._export()
+        return super().submit(self._instrumented, fn, *args, **kwargs)
+
+    def _instrumented(self, fn: Callable, *args, **kwargs):
+        with self._stats_lock:
+            self.queued -= 1
+            self.busy += 1
+            self._export()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            with self._stats_lock:
+                self.busy -= 1
+                self._export()
+
+    def _export(self) -> None:
+        Metrics.set_gauge(f"executor.{self.name}.queue_length", self.queued)
+        Metrics.set_gauge(f"executor.{self.name}.busy", self.busy)
+
+
+class ExecutorRegistry:
+    """Các thread pool riêng theo loại công việc thay cho executor mặc định.
+
+    Tách network / cpu / storage / disk để một đợt upload chậm không chặn
+    parse hay ghi đĩa và ngược lại. Kích thước đổi được qua biến môi trường
+    EXECUTOR_<NAME>_WORKERS.
+
+    Các pool dùng chung cả process nên mỗi owner (vd. MangaLeecher) gọi
+    acquire() khi khởi tạo và await release() khi đóng; pool chỉ bị đóng
+    khi owner cuối cùng release.
+    """
+
+    DEFAULT_SIZES = {
+        "network": 16,
+        "cpu": os.cpu_count() or 1,
+        "storage": 64,
+        "disk": 4,
+    }
+
+    _executors: Dict[str, InstrumentedThreadPool] = {}
+    _owners = 0
+    _lock = threading.Lock()
+
+    @classmethod
+    def size(cls, name: str) -> int:
+        env_value = os.getenv(f"EXECUTOR_{name.upper()}_WORKERS")
+        if env_value and env_value.isdigit():
+            return max(1, int(env_value))
+        return cls.DEFAULT_SIZES[name]
+
+    @classmethod
+    def get(cls, name: str) -> InstrumentedThreadPool:
+        if name not in cls.DEFAULT_SIZES:
+            raise ValueError(f"Executor không tồn tại: {name}")
+        with cls._lock:
+            if name not in cls._executors:
+                cls._executors[name] = InstrumentedThreadPool(name, cls.size(name))
+            return cls._executors[name]
+
+    @classmethod
+    async def run(cls, name: str, fn: Callable, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            cls.get(name), functools.partial(fn, *args, **kwargs)
+        )
+
+    @classmethod
+    def acquire(cls) -> None:
+        with cls._lock:
+            cls._owners += 1
+
+    @classmethod
+    async def release(cls) -> None:
+        """Trả registry; owner cuối cùng đóng các pool ngoài event loop"""
+        with cls._lock:
+            cls._owners = max(0, cls._owners - 1)
+            if cls._owners:
+                return
+            executors = list(cls._executors.values())
+            cls._executors.clear()
+        await asyncio.to_thread(cls._shutdown_executors, executors)
+
+    @classmethod
+    def shutdown(cls) -> None:
+        """Đóng mọi pool bất kể owner (dùng khi process sắp thoát)"""
+        with cls._lock:
+            executors = list(cls._executors.values())
+            cls._executors.clear()
+        cls._shutdown_executors(executors)
+
+    @staticmethod
+    def _shutdown_executors(executors: List[InstrumentedThreadPool]) -> None:
+        for executor in executors:
+            executor.shutdown(wait=True, cancel_futures=True)
@@ -0,0 +1,136 @@
+import asyncio
+import importlib.util
+from contextlib import asynccontextmanager, nullcontext
+from typing import AsyncIterator, Dict, Optional
+
+import httpx
+
+from shared.concurrency import ConcurrencyLimiter, SlotOutcome
+from shared.logger import logging
+from shared.rate_limiter import RateLimiterRegistry
+
+
+class AsyncHttpSession:
+    """HTTP client bất đồng bộ dùng chung cho leecher và parser của một source.
+
+    httpx giữ pool kết nối riêng cho từng host (keep-alive), và dùng HTTP/2
+    multiplexing khi CDN hỗ trợ nên không cần giữ một thread cho mỗi request.
+    """
+
+    DEFAULT_TIMEOUT = 30
+    CONNECT_TIMEOUT = 10
+    MAX_CONNECTIONS = 100
+    MAX_KEEPALIVE_CONNECTIONS = 20
+    KEEPALIVE_EXPIRY = 30
+    MAX_RETRIES = 3
+    BACKOFF_FACTOR = 2
+    RETRY_STATUSES = {413, 429, 500, 502, 503, 504}
+    HTTP2_ENABLED = importlib.util.find_spec("h2") is not None
+
+    def __init__(
+        self,
+        source_name: str,
+        headers: Optional[Dict[str, str]] = None,
+        rate_limiters: Optional[RateLimiterRegistry] = None,
+    ):
+        self.source_name = source_name
+        self.rate_limiters = rate_limiters
+        self.logger = logging.getLogger(__name__)
+        self.client = httpx.AsyncClient(
+            headers=headers,
+            http2=self.HTTP2_ENABLED,
+            follow_redirects=True,
+            timeout=httpx.Timeout(self.DEFAULT_TIMEOUT, connect=self.CONNECT_TIMEOUT),
+            # Client bỏ qua limits khi có transport riêng: phải đặt ở transport
+            transport=httpx.AsyncHTTPTransport(
+                http2=self.HTTP2_ENABLED,
+                retries=self.MAX_RETRIES,
+                limits=httpx.Limits(
+                    max_connections=self.MAX_CONNECTIONS,
+                    max_keepalive_connections=self.MAX_KEEPALIVE_CONNECTIONS,
+                    keepalive_expiry=self.KEEPALIVE_EXPIRY,
+                ),
+            ),
+        )
+
+    async def get(
+        self,
+        url: str,
+        headers: Optional[Dict[str, str]] = None,
+        timeout: Optional[float] = None,
+        concurrency: Optional[ConcurrencyLimiter] = None,
+    ) -> httpx.Response:
+        """GET và đọc toàn bộ body, xem stream()"""
+        async with self.stream(url, headers, timeout, concurrency) as response:
+            await response.aread()
+        return response
+
+    @asynccontextmanager
+    async def stream(
+        self,
+        url: str,
+        headers: Optional[Dict[str, str]] = None,
+        timeout: Optional[float] = None,
+        concurrency: Optional[ConcurrencyLimiter] = None,
+    ) -> AsyncIterator[httpx.Response]:
+        """GET dạng stream với retry cho các status tạm thời, tôn trọng Retry-After.
+
+        Mỗi request đi qua rate limiter của host (nếu có) và báo lại status
+        để limiter tự giảm/tăng tốc. Nếu truyền concurrency, chỉ thời gian
+        request thực tế (không tính thời gian chờ rate limit) được đo, gồm
+        cả thời gian caller đọc body; chỉ 429/5xx và lỗi transport tính là
+        thất bại.
+        """
+        request_timeout = timeout if timeout is not None else self.DEFAULT_TIMEOUT
+        limiter = (
+            self.rate_limiters.get(self.source_name, httpx.URL(url).host)
+            if self.rate_limiters
+            else None
+        )
+
+        for attempt in range(self.MAX_RETRIES + 1):
+            if limiter:
+                await limiter.acquire()
+            async with (
+                concurrency.slot() if concurrency else nullcontext(SlotOutcome())
+            ) as outcome:
+                request = self.client.build_request(
+                    "GET", url, headers=headers, timeout=request_timeout
+                )
+                response = await self.client.send(request, stream=True)
+                # Chỉ 429/5xx và lỗi transport là dấu hiệu server quá tải; lỗi
+                # caller raise vì response không dùng được (404, trang HTML...)
+                # không được kéo giới hạn concurrency xuống
+                outcome.failed = response.status_code in self.RETRY_STATUSES
+                try:
+                    if limiter:
+                        limiter.on_response(
+                            response.status_code, response.headers.get("Retry-After")
+                        )
+                    if (
+                        response.status_code not in self.RETRY_STATUSES
+                        or attempt == self.MAX_RETRIES
+                    ):
+                        try:
+                            yield response
+                        except httpx.TransportError:
+                            outcome.failed = True
+                            raise
+                        return
+                finally:
+                    await response.aclose()
+
+            delay = self._retry_delay(response, attempt)
+            self.logger.debug(
+                f"HTTP {response.status_code} [{url}], thử lại sau {delay:.1f}s"
+            )
+            await asyncio.sleep(delay)
+
+    def _retry_delay(self, response: httpx.Response, attempt: int) -> float:
+        retry_after = response.headers.get("Retry-After")
+        if retry_after and retry_after.isdigit():
+            return float(retry_after)
+        return self.BACKOFF_FACTOR * (2**attempt)
+
+    async def aclose(self) -> None:
+        await self.client.aclose()
@@ -0,0 +1,183 @@
+import hashlib
+from tempfile import SpooledTemporaryFile
+from typing import Dict, Optional
+
+from shared.concurrency import ConcurrencyLimiter
+from shared.http_client import AsyncHttpSession
+from shared.image_utils import ImageConverter
+from shared.memory_budget import MemoryBudget
+from shared.metrics import Metrics
+
+
+class ImageRejected(Exception):
+    """Response không phải ảnh dùng được (HTTP lỗi, trang HTML, quá lớn...)"""
+
+
+class DownloadedImage:
+    """Ảnh đã tải vào buffer spool: giữ trong RAM, tràn ra đĩa khi lớn.
+
+    Giữ phần ngân sách bộ nhớ đã xin lúc tải cho tới khi aclose().
+    """
+
+    def __init__(
+        self,
+        buffer: SpooledTemporaryFile,
+        size: int,
+        sha256: str,
+        image_format: str,
+        reservation: "_Reservation",
+    ):
+        self.buffer = buffer
+        self.size = size
+        self.sha256 = sha256
+        self.format = image_format
+        self.reservation = reservation
+
+    def read(self, size: int = -1) -> bytes:
+        self.buffer.seek(0)
+        return self.buffer.read(size)
+
+    async def aclose(self) -> None:
+        self.buffer.close()
+        await self.reservation.release()
+
+
+class _Reservation:
+    """Phần ngân sách DOWNLOAD đã xin cho một ảnh, tăng dần theo body"""
+
+    def __init__(self, budget: Optional[MemoryBudget]):
+        self.budget = budget
+        self.nbytes = 0
+
+    async def grow_to(self, nbytes: int) -> None:
+        if nbytes <= self.nbytes:
+            return
+        if self.budget is not None:
+            # Chỉ chờ ở lần xin đầu; khi body đã bắt đầu chảy thì chỉ ghi nhận
+            if self.nbytes == 0:
+                await self.budget.acquire(nbytes, MemoryBudget.DOWNLOAD)
+            else:
+                self.budget.charge(nbytes - self.nbytes, MemoryBudget.DOWNLOAD)
+        self.nbytes = nbytes
+
+    async def trim(self, nbytes: int) -> None:
+        """Trả lại phần xin dư so với kích thước thực"""
+        if self.budget is not None and self.nbytes > nbytes:
+            await self.budget.release(self.nbytes - nbytes, MemoryBudget.DOWNLOAD)
+        self.nbytes = min(self.nbytes, nbytes)
+
+    async def release(self) -> None:
+        if self.budget is not None and self.nbytes:
+            await self.budget.release(self.nbytes, MemoryBudget.DOWNLOAD)
+        self.nbytes = 0
+
+
+class ImageDownloader:
+    """Tải ảnh dạng stream, kiểm tra trước khi decode.
+
+    Content-Type và Content-Length được kiểm tra ngay khi có header; vài
+    byte đầu tiên phải là magic bytes của một định dạng ảnh hỗ trợ, nên
+    trang lỗi HTML trả về status 200 bị loại mà không phải tải hết body.
+    Kích thước tối đa được kiểm tra trong lúc stream, và hash SHA-256
+    được tính dần theo từng chunk.
+
+    Nếu có memory_budget, bytes của ảnh được xin trước theo Content-Length,
+    hoặc theo từng bước RESERVE_STEP khi server không gửi Content-Length.
+    """
+
+    MAX_IMAGE_BYTES = 50 * 1024 * 1024
+    SPOOL_THRESHOLD = 2 * 1024 * 1024
+    SNIFF_BYTES = 16
+    RESERVE_STEP = 1024 * 1024
+    REJECTED_CONTENT_TYPES = ("text/", "html", "json", "javascript")
+
+    def __init__(
+        self,
+        max_bytes: int = MAX_IMAGE_BYTES,
+        spool_threshold: int = SPOOL_THRESHOLD,
+        memory_budget: Optional[MemoryBudget] = None,
+    ):
+        self.max_bytes = max_bytes
+        self.spool_threshold = spool_threshold
+        self.memory_budget = memory_budget
+
+    async def download(
+        self,
+        session: AsyncHttpSession,
+        url: str,
+        headers: Optional[Dict[str, str]] = None,
+        timeout: Optional[float] = None,
+        concurrency: Optional[ConcurrencyLimiter] = None,
+    ) -> DownloadedImage:
+        buffer = SpooledTemporaryFile(max_size=self.spool_threshold)
+        reservation = _Reservation(self.memory_budget)
+        try:
+            async with session.stream(url, headers, timeout, concurrency) as response:
+                content_length = self._check_headers(response)
+                await reservation.grow_to(content_length or self.RESERVE_STEP)
+                size, sha256, image_format = await self._read_body(
+                    response, buffer, reservation
+                )
+            await reservation.trim(size)
+        except ImageRejected:
+            buffer.close()
+            await reservation.release()
+            Metrics.inc("download.rejected")
+            raise
+        except BaseException:
+            buffer.close()
+            await reservation.release()
+            raise
+
+        Metrics.inc("download.bytes", size)
+        if size > self.spool_threshold:
+            Metrics.inc("download.spilled")
+        return DownloadedImage(buffer, size, sha256, image_format, reservation)
+
+    def _check_headers(self, response) -> int:
+        """Kiểm tra header, trả về Content-Length (0 nếu không có)"""
+        if response.status_code != 200:
+            raise ImageRejected(f"HTTP {response.status_code}")
+
+        content_type = response.headers.get("Content-Type", "").lower()
+        if any(marker in content_type for marker in self.REJECTED_CONTENT_TYPES):
+            raise ImageRejected(f"Content-Type {content_type}")
+
+        content_length = response.headers.get("Content-Length", "")
+        if content_length.isdigit() and int(content_length) > self.max_bytes:
+            raise ImageRejected(f"Content-Length {content_length} quá lớn")
+        return int(content_length) if content_length.isdigit() else 0
+
+    async def _read_body(
+        self, response, buffer: SpooledTemporaryFile, reservation: _Reservation
+    ):
+        digest = hashlib.sha256()
+        head = b""
+        image_format = None
+        size = 0
+
+        async for chunk in response.aiter_bytes():
+            size += len(chunk)
+            if size > self.max_bytes:
+                raise ImageRejected(f"Ảnh vượt quá {self.max_bytes} bytes")
+            if size > reservation.nbytes:
+                await reservation.grow_to(min(self.max_bytes, size + self.RESERVE_STEP))
+
+            if image_format is None:
+                head = (head + chunk)[: self.SNIFF_BYTES]
+                if len(head) >= self.SNIFF_BYTES:
+                    image_format = self._sniff(head)
+
+            digest.update(chunk)
+            buffer.write(chunk)
+
+        if image_format is None:
+            image_format = self._sniff(head)
+        return size, digest.hexdigest(), image_format
+
+    @staticmethod
+    def _sniff(head: bytes) -> str:
+        image_format = ImageConverter.detect_format(head)
+        if image_format is None:
+            raise ImageRejected(f"Không phải ảnh (bắt đầu bằng {head[:8]!r})")
+        return image_format
@@ -1,6 +1,7 @@
 from io import BytesIO
 import logging
-from typing import Optional, Tuple
+import struct
+from typing import List, Optional, Tuple
 from PIL import Image
 
 logger = logging.getLogger(__name__)
@@ -10,6 +11,66 @@ class ImageConverter:
     DEFAULT_WEBP_QUALITY = 85
     DEFAULT_JPEG_QUALITY = 90
     MAX_WEBP_SIZE = 16383
+    MAX_IMAGE_PIXELS = 120_000_000
+    TILE_HEIGHT = 8192
+    DEFAULT_PASSTHROUGH_MAX_BPP = 0.5
+
+    @staticmethod
+    def detect_format(image_data: bytes) -> Optional[str]:
+        """Nhận dạng định dạng ảnh qua magic bytes, không decode"""
+        if image_data[:3] == b"\xff\xd8\xff":
+            return "JPEG"
+        if image_data[:8] == b"\x89PNG\r\n\x1a\n":
+            return "PNG"
+        if image_data[:4] == b"RIFF" and image_data[8:12] == b"WEBP":
+            return "WEBP"
+        if image_data[:6] in (b"GIF87a", b"GIF89a"):
+            return "GIF"
+        return None
+
+    @staticmethod
+    def probe_webp_size(image_data: bytes) -> Optional[Tuple[int, int]]:
+        """Đọc kích thước WebP tĩnh từ header chunk (VP8/VP8L/VP8X).
+
+        Trả về None nếu không phải WebP hợp lệ hoặc là WebP động.
+        """
+        if len(image_data) < 30 or ImageConverter.detect_format(image_data) != "WEBP":
+            return None
+
+        chunk = image_data[12:16]
+        if chunk == b"VP8 " and image_data[23:26] == b"\x9d\x01\x2a":
+            width, height = struct.unpack("<HH", image_data[26:30])
+            return width & 0x3FFF, height & 0x3FFF
+        if chunk == b"VP8L" and image_data[20] == 0x2F:
+            bits = int.from_bytes(image_data[21:25], "little")
+            return (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+        if chunk == b"VP8X":
+            if image_data[20] & 0x02:  # animation flag
+                return None
+            width = int.from_bytes(image_data[24:27], "little") + 1
+            height = int.from_bytes(image_data[27:30], "little") + 1
+            return width, height
+        return None
+
+    @staticmethod
+    def is_passthrough_webp(
+        image_data: bytes,
+        max_bytes_per_pixel: float = DEFAULT_PASSTHROUGH_MAX_BPP,
+        file_size: Optional[int] = None,
+    ) -> bool:
+        """WebP nguồn đủ nhỏ để upload nguyên bản, bỏ qua decode + re-encode.
+
+        image_data có thể chỉ là phần đầu file (header) nếu truyền file_size.
+        """
+        size = ImageConverter.probe_webp_size(image_data)
+        if not size:
+            return False
+
+        width, height = size
+        if max(width, height) > ImageConverter.MAX_WEBP_SIZE:
+            return False
+        file_size = len(image_data) if file_size is None else file_size
+        return file_size / (width * height) <= max_bytes_per_pixel
 
     @staticmethod
     def to_webp(
@@ -17,40 +78,23 @@ class ImageConverter:
     ) -> Tuple[Optional[bytes], int]:
 
         try:
+            # Image.open chỉ đọc header, chưa decode pixel
             image = Image.open(BytesIO(image_data))
+            ImageConverter.check_pixel_limit(image.size)
 
-            if (
-                image.width > ImageConverter.MAX_WEBP_SIZE
-                or image.height > ImageConverter.MAX_WEBP_SIZE
-            ):
+            target_size = ImageConverter.fit_within(
+                image.size, ImageConverter.MAX_WEBP_SIZE
+            )
+            if target_size != image.size:
                 logger.warning(
                     f"Image size {image.size} exceeds WebP limit ({ImageConverter.MAX_WEBP_SIZE}px). Resizing..."
                 )
-                resized_data, _ = ImageConverter.resize_image(
-                    image_data,
-                    max_width=ImageConverter.MAX_WEBP_SIZE,
-                    max_height=ImageConverter.MAX_WEBP_SIZE,
-                )
-                if resized_data:
-                    image = Image.open(BytesIO(resized_data))
-
-            # Convert to RGB if necessary
-            if image.mode in ("RGBA", "LA", "P"):
-                background = Image.new("RGB", image.size, (255, 255, 255))
-                if image.mode == "P":
-                    image = image.convert("RGBA")
-                if image.mode in ("RGBA", "LA"):
-                    background.paste(image, mask=image.split()[-1])
-                else:
-                    background.paste(image)
-                image = background
-            elif image.mode != "RGB":
-                image = image.convert("RGB")
+                image = ImageConverter.decode_reduced(image, target_size)
+
+            image = ImageConverter.flatten_to_rgb(image)
 
             # Convert to WebP
-            output = BytesIO()
-            image.save(output, format="WEBP", quality=quality, method=6)
-            webp_data = output.getvalue()
+            webp_data, _ = ImageConverter.encode_webp(image, quality)
 
             compression_ratio = len(webp_data) / len(image_data) * 100
             logger.debug(
@@ -64,6 +108,72 @@ class ImageConverter:
             logger.error(f"Error convert WebP: {e}")
             return None, 0
 
+    @staticmethod
+    def encode_webp(
+        image: Image.Image, quality: int = DEFAULT_WEBP_QUALITY
+    ) -> Tuple[bytes, int]:
+        """Encode ảnh RGB đã decode sang WebP"""
+        output = BytesIO()
+        image.save(output, format="WEBP", quality=quality, method=6)
+        webp_data = output.getvalue()
+        return webp_data, len(webp_data)
+
+    @staticmethod
+    def tile_bounds(
+        height: int, tile_height: int = TILE_HEIGHT
+    ) -> List[Tuple[int, int]]:
+        """Chia chiều cao thành các đoạn (top, bottom) liên tiếp"""
+        return [
+            (top, min(top + tile_height, height))
+            for top in range(0, height, tile_height)
+        ]
+
+    @staticmethod
+    def check_pixel_limit(size: Tuple[int, int]) -> None:
+        """Chặn decompression bomb trước khi decode toàn bộ ảnh"""
+        width, height = size
+        if width * height > ImageConverter.MAX_IMAGE_PIXELS:
+            raise Image.DecompressionBombError(
+                f"Image size {size} vượt giới hạn "
+                f"{ImageConverter.MAX_IMAGE_PIXELS} pixels"
+            )
+
+    @staticmethod
+    def fit_within(size: Tuple[int, int], max_side: int) -> Tuple[int, int]:
+        """Kích thước lớn nhất giữ tỉ lệ mà không cạnh nào vượt max_side"""
+        width, height = size
+        scale = min(1.0, max_side / width, max_side / height)
+        if scale >= 1.0:
+            return size
+        return max(1, int(width * scale)), max(1, int(height * scale))
+
+    @staticmethod
+    def decode_reduced(image: Image.Image, target_size: Tuple[int, int]) -> Image.Image:
+        """Decode một lần và thu nhỏ về target_size.
+
+        Với JPEG, draft() để decoder tự giảm 1/2, 1/4, 1/8 ngay khi đọc;
+        reducing_gap cho phép Pillow dùng reduce() trước LANCZOS.
+        """
+        if image.format == "JPEG":
+            image.draft("RGB", target_size)
+        return image.resize(target_size, Image.Resampling.LANCZOS, reducing_gap=2.0)
+
+    @staticmethod
+    def flatten_to_rgb(image: Image.Image) -> Image.Image:
+        """Chuyển về RGB, nền trắng cho ảnh có alpha"""
+        if image.mode in ("RGBA", "LA", "P"):
+            background = Image.new("RGB", image.size, (255, 255, 255))
+            if image.mode == "P":
+                image = image.convert("RGBA")
+            if image.mode in ("RGBA", "LA"):
+                background.paste(image, mask=image.split()[-1])
+            else:
+                background.paste(image)
+            return background
+        if image.mode != "RGB":
+            return image.convert("RGB")
+        return image
+
     @staticmethod
     def resize_image(
         image_data: bytes,
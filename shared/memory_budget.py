@@ -0,0 +1,106 @@
+import asyncio
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import Optional
+
+from shared.metrics import Metrics
+
+
+class MemoryBudget:
+    """Semaphore theo bytes cho dữ liệu ảnh in-flight của cả process.
+
+    Mỗi bước giữ bộ nhớ xin trước số bytes sẽ dùng và chờ khi hết ngân sách
+    thay vì cấp phát rồi bị OOM-kill. Các bước xếp theo level (tải về ->
+    decode -> ảnh đã encode chờ upload); level sau được dùng tới trần cao
+    hơn level trước, và luôn được cấp nếu chưa có gì in-flight ở level đó
+    trở về sau. Nhờ vậy ảnh đã tải không thể chiếm hết ngân sách làm bước
+    encode (nơi giải phóng chúng) bị kẹt.
+    """
+
+    DOWNLOAD = 0
+    DECODE = 1
+    ENCODED = 2
+    LEVEL_NAMES = ("download", "decode", "encoded")
+    LEVEL_CEILINGS = (0.5, 0.85, 1.0)
+
+    DEFAULT_LIMIT = 1024 * 1024 * 1024
+    # Phần bộ nhớ của container dành cho dữ liệu ảnh
+    CGROUP_FRACTION = 0.5
+    CGROUP_LIMIT_FILES = (
+        "/sys/fs/cgroup/memory.max",
+        "/sys/fs/cgroup/memory/memory.limit_in_bytes",
+    )
+
+    def __init__(self, limit: Optional[int] = None):
+        self.limit = limit or self.default_limit()
+        self.used = [0] * len(self.LEVEL_NAMES)
+        self._cond = asyncio.Condition()
+        self.export()
+
+    @classmethod
+    def default_limit(cls) -> int:
+        """MEMORY_BUDGET_MB nếu có, không thì một nửa giới hạn cgroup"""
+        env_value = os.getenv("MEMORY_BUDGET_MB")
+        if env_value and env_value.isdigit():
+            return int(env_value) * 1024 * 1024
+
+        for path in cls.CGROUP_LIMIT_FILES:
+            try:
+                with open(path) as f:
+                    value = f.read().strip()
+            except OSError:
+                continue
+            # cgroup v1 không giới hạn trả về một số rất lớn
+            if value.isdigit() and int(value) < 1 << 60:
+                return int(int(value) * cls.CGROUP_FRACTION)
+        return cls.DEFAULT_LIMIT
+
+    @property
+    def in_use(self) -> int:
+        return sum(self.used)
+
+    def _can_admit(self, nbytes: int, level: int) -> bool:
+        if sum(self.used[level:]) == 0:
+            return True
+        return self.in_use + nbytes <= self.limit * self.LEVEL_CEILINGS[level]
+
+    async def acquire(self, nbytes: int, level: int) -> None:
+        async with self._cond:
+            if not self._can_admit(nbytes, level):
+                Metrics.inc("memory.budget.waits")
+                waited_at = time.monotonic()
+                await self._cond.wait_for(lambda: self._can_admit(nbytes, level))
+                Metrics.inc("memory.budget.wait_seconds", time.monotonic() - waited_at)
+            self.used[level] += nbytes
+            self.export()
+
+    def charge(self, nbytes: int, level: int) -> None:
+        """Ghi nhận bytes đã dùng mà không chờ (vd. body lớn dần khi đang tải).
+
+        Chờ giữa chừng sẽ khiến các lượt tải đang giữ ngân sách chờ lẫn
+        nhau; phần vượt trần được tính vào để các yêu cầu mới phải chờ.
+        """
+        self.used[level] += nbytes
+        self.export()
+
+    async def release(self, nbytes: int, level: int) -> None:
+        async with self._cond:
+            self.used[level] -= nbytes
+            self.export()
+            self._cond.notify_all()
+
+    @asynccontextmanager
+    async def reserve(self, nbytes: int, level: int):
+        await self.acquire(nbytes, level)
+        try:
+            yield
+        finally:
+            await self.release(nbytes, level)
+
+    def export(self) -> None:
+        """Ghi các gauge ngân sách; gọi lại sau Metrics.reset()"""
+        Metrics.set_gauge("memory.budget.limit", self.limit)
+        Metrics.set_gauge("memory.budget.used", self.in_use)
+        for name, used in zip(self.LEVEL_NAMES, self.used):
+            Metrics.set_gauge(f"memory.budget.{name}_bytes", used)
@@ -0,0 +1,43 @@
+import threading
+from typing import Dict, Union
+
+Number = Union[int, float]
+
+
+class Metrics:
+    """Registry counter/gauge trong process, dùng để log và export trạng thái"""
+
+    _counters: Dict[str, Number] = {}
+    _gauges: Dict[str, Number] = {}
+    _lock = threading.Lock()
+
+    @classmethod
+    def inc(cls, name: str, value: Number = 1) -> None:
+        with cls._lock:
+            cls._counters[name] = cls._counters.get(name, 0) + value
+
+    @classmethod
+    def set_gauge(cls, name: str, value: Number) -> None:
+        with cls._lock:
+            cls._gauges[name] = value
+
+    @classmethod
+    def get(cls, name: str, default: Number = 0) -> Number:
+        with cls._lock:
+            return cls._counters.get(name, cls._gauges.get(name, default))
+
+    @classmethod
+    def ratio(cls, numerator: str, denominator: str) -> float:
+        total = cls.get(denominator)
+        return cls.get(numerator) / total if total else 0.0
+
+    @classmethod
+    def snapshot(cls) -> Dict[str, Number]:
+        with cls._lock:
+            return {**cls._counters, **cls._gauges}
+
+    @classmethod
+    def reset(cls) -> None:
+        with cls._lock:
+            cls._counters.clear()
+            cls._gauges.clear()
@@ -0,0 +1,93 @@
+import sqlite3
+import time
+from pathlib import Path
+from typing import Dict, Optional
+
+from shared.metrics import Metrics
+
+
+class PageValidators:
+    """Validator của một trang: ETag, Last-Modified và hash vùng nội dung"""
+
+    def __init__(
+        self,
+        etag: Optional[str] = None,
+        last_modified: Optional[str] = None,
+        content_hash: Optional[str] = None,
+    ):
+        self.etag = etag
+        self.last_modified = last_modified
+        self.content_hash = content_hash
+
+    @classmethod
+    def from_response(cls, response, content_hash: Optional[str]) -> "PageValidators":
+        return cls(
+            response.headers.get("ETag"),
+            response.headers.get("Last-Modified"),
+            content_hash,
+        )
+
+    def request_headers(self) -> Dict[str, str]:
+        """Header cho GET có điều kiện"""
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+
+class PageNotModified(Exception):
+    """Trang không đổi so với lần tải thành công trước (304 hoặc cùng hash)"""
+
+
+class PageValidatorCache:
+    """Cache validator theo URL trong file SQLite cục bộ, còn lại sau restart.
+
+    Validator chỉ nên được ghi sau khi đã xử lý xong trang; nếu ghi sớm mà
+    lượt xử lý lỗi, lần sau trang sẽ bị coi là không đổi và bị bỏ qua.
+    """
+
+    DB_FILENAME = ".page_cache.sqlite"
+
+    def __init__(self, storage_path: Path):
+        self.conn = sqlite3.connect(storage_path / self.DB_FILENAME)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS pages ("
+            "url TEXT PRIMARY KEY, etag TEXT, last_modified TEXT, "
+            "content_hash TEXT, updated_at REAL NOT NULL)"
+        )
+        self.conn.commit()
+
+    def get(self, url: str) -> Optional[PageValidators]:
+        row = self.conn.execute(
+            "SELECT etag, last_modified, content_hash FROM pages WHERE url = ?",
+            (url,),
+        ).fetchone()
+        return PageValidators(*row) if row else None
+
+    def put(self, url: str, validators: PageValidators) -> None:
+        self.conn.execute(
+            "INSERT OR REPLACE INTO pages "
+            "(url, etag, last_modified, content_hash, updated_at) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (
+                url,
+                validators.etag,
+                validators.last_modified,
+                validators.content_hash,
+                time.time(),
+            ),
+        )
+        self.conn.commit()
+
+    @staticmethod
+    def record(outcome: str) -> None:
+        """Đếm một lượt tải có điều kiện: "not_modified" hoặc "changed" """
+        Metrics.inc("page_cache.requests")
+        Metrics.inc(f"page_cache.{outcome}")
+
+    def close(self) -> None:
+        self.conn.close()
@@ -0,0 +1,156 @@
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Iterable, List, Optional
+
+from shared.logger import logging
+from shared.metrics import Metrics
+
+StageHandler = Callable[[Any], Awaitable[Optional[Any]]]
+DropHandler = Callable[[Any], Awaitable[None]]
+
+_STOP = object()
+
+
+class PipelineStage:
+    """Một stage: hàng đợi vào có giới hạn + số worker riêng"""
+
+    def __init__(self, name: str, handler: StageHandler, workers: int, queue_size: int):
+        self.name = name
+        self.handler = handler
+        self.workers = max(1, workers)
+        self.workers_stopped = 0
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max(1, queue_size))
+
+
+class StagedPipeline:
+    """Pipeline nhiều stage nối bằng asyncio.Queue có giới hạn.
+
+    Mỗi item đi qua các stage theo thứ tự; handler trả về None để loại item
+    (lỗi hoặc đã xử lý xong sớm). Hàng đợi đầy sẽ chặn stage phía trước
+    (backpressure). Mỗi stage export độ sâu hàng đợi, thời gian worker ngồi
+    chờ input (idle) và thời gian bị chặn khi đẩy sang stage sau (blocked).
+
+    on_drop (nếu có) được gọi với mọi item bị loại giữa chừng: handler trả
+    None hoặc lỗi, bị cancel khi đang xử lý, hay còn nằm trong hàng đợi khi
+    pipeline dừng; dùng để trả tài nguyên item đang giữ. on_drop phải gọi
+    lại được nhiều lần trên cùng một item.
+    """
+
+    def __init__(self, name: str, on_drop: Optional[DropHandler] = None):
+        self.name = name
+        self.on_drop = on_drop
+        self.stages: List[PipelineStage] = []
+        self.logger = logging.getLogger(__name__)
+
+    def add_stage(
+        self,
+        name: str,
+        handler: StageHandler,
+        workers: int = 1,
+        queue_size: Optional[int] = None,
+    ) -> "StagedPipeline":
+        self.stages.append(
+            PipelineStage(name, handler, workers, queue_size or workers * 2)
+        )
+        return self
+
+    async def run(self, items: Iterable[Any]) -> List[Any]:
+        """Chạy toàn bộ item qua pipeline, trả về output của stage cuối"""
+        results: List[Any] = []
+        workers = [
+            asyncio.create_task(self._worker(index, results))
+            for index, stage in enumerate(self.stages)
+            for _ in range(stage.workers)
+        ]
+
+        try:
+            first = self.stages[0]
+            for item in items:
+                await self._put(first, item, "input")
+            for _ in range(first.workers):
+                await first.queue.put(_STOP)
+            await asyncio.gather(*workers)
+        finally:
+            for task in workers:
+                task.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+            await self._drain()
+
+        return results
+
+    async def _worker(self, index: int, results: List[Any]) -> None:
+        stage = self.stages[index]
+        next_stage = self.stages[index + 1] if index + 1 < len(self.stages) else None
+
+        while True:
+            waited_at = time.monotonic()
+            item = await stage.queue.get()
+            Metrics.inc(
+                self._metric(stage, "idle_seconds"), time.monotonic() - waited_at
+            )
+            self._export_depth(stage)
+
+            if item is _STOP:
+                await self._stop_worker(stage, next_stage)
+                return
+
+            try:
+                output = await stage.handler(item)
+            except asyncio.CancelledError:
+                await self._drop(item)
+                raise
+            except Exception as e:
+                self.logger.error(f"Lỗi stage {stage.name}: {e}")
+                output = None
+
+            if output is None:
+                await self._drop(item)
+                continue
+            Metrics.inc(self._metric(stage, "processed"))
+            if next_stage is None:
+                results.append(output)
+                continue
+            try:
+                await self._put(next_stage, output, stage.name)
+            except asyncio.CancelledError:
+                await self._drop(output)
+                raise
+
+    async def _stop_worker(
+        self, stage: PipelineStage, next_stage: Optional[PipelineStage]
+    ) -> None:
+        # Worker cuối cùng của stage dừng thì báo dừng cho stage sau
+        stage.workers_stopped += 1
+        if next_stage is not None and stage.workers_stopped == stage.workers:
+            for _ in range(next_stage.workers):
+                await next_stage.queue.put(_STOP)
+
+    async def _drain(self) -> None:
+        """Loại các item còn trong hàng đợi khi pipeline dừng giữa chừng"""
+        for stage in self.stages:
+            while not stage.queue.empty():
+                await self._drop(stage.queue.get_nowait())
+            self._export_depth(stage)
+
+    async def _drop(self, item: Any) -> None:
+        if self.on_drop is None or item is _STOP:
+            return
+        try:
+            await self.on_drop(item)
+        except Exception as e:
+            self.logger.error(f"Lỗi trả tài nguyên item {self.name}: {e}")
+
+    async def _put(self, stage: PipelineStage, item: Any, producer: str) -> None:
+        blocked_at = time.monotonic()
+        await stage.queue.put(item)
+        Metrics.inc(
+            f"pipeline.{self.name}.{producer}.blocked_seconds",
+            time.monotonic() - blocked_at,
+        )
+        self._export_depth(stage)
+
+    def _export_depth(self, stage: PipelineStage) -> None:
+        Metrics.set_gauge(self._metric(stage, "queue_depth"), stage.queue.qsize())
+
+    def _metric(self, stage: PipelineStage, name: str) -> str:
+        return f"pipeline.{self.name}.{stage.name}.{name}"
@@ -0,0 +1,93 @@
+import asyncio
+import hashlib
+from typing import Dict, Optional, Set, Tuple
+
+from shared.executors import ExecutorRegistry
+from shared.logger import logging
+from shared.metrics import Metrics
+from shared.r2_storage import R2Storage
+
+
+class R2Manifest:
+    """Cache danh sách object đã có trên R2 theo prefix (key -> size, etag).
+
+    Mỗi prefix chỉ được list một lần (ListObjectsV2, phân trang); prefix
+    con của một prefix đã list thì dùng lại kết quả. Upload thành công được
+    ghi thêm vào cache (kèm MD5 nội dung) nên cache luôn phản ánh những gì
+    đã PUT trong lần chạy này. Xong một series thì evict() prefix của nó để
+    cache không lớn dần theo số series đã xử lý.
+    """
+
+    def __init__(self, storage: R2Storage):
+        self.storage = storage
+        self.logger = logging.getLogger(__name__)
+        # Nhóm theo "thư mục" (prefix đến dấu / cuối) để tra theo chapter nhanh
+        self._folders: Dict[str, Dict[str, Tuple[int, Optional[str]]]] = {}
+        self._listed: Set[str] = set()
+        self._locks: Dict[str, asyncio.Lock] = {}
+
+    def _is_listed(self, prefix: str) -> bool:
+        return any(prefix.startswith(listed) for listed in self._listed)
+
+    async def load(self, prefix: str) -> None:
+        if self._is_listed(prefix):
+            return
+
+        lock = self._locks.setdefault(prefix, asyncio.Lock())
+        async with lock:
+            if self._is_listed(prefix):
+                return
+            objects = await ExecutorRegistry.run(
+                "storage", self.storage.list_prefix, prefix
+            )
+            Metrics.inc("r2.manifest.list_requests")
+            for key, (size, etag) in objects.items():
+                self.add(key, size, etag)
+            self._listed.add(prefix)
+            self._locks.pop(prefix, None)
+            self.logger.debug(f"📋 Manifest {prefix}: {len(objects)} objects")
+
+    async def folder(self, prefix: str) -> Dict[str, Tuple[int, Optional[str]]]:
+        """Các object nằm trực tiếp trong thư mục prefix (kết thúc bằng /)"""
+        await self.load(prefix)
+        return dict(self._folders.get(prefix, {}))
+
+    def get(self, object_key: str) -> Optional[Tuple[int, Optional[str]]]:
+        return self._folders.get(self._folder_of(object_key), {}).get(object_key)
+
+    def matches(self, object_key: str, data: bytes) -> bool:
+        """Object đã có với cùng nội dung: cùng kích thước và cùng MD5 nếu biết.
+
+        ETag của multipart upload (có dấu "-") không phải MD5 nội dung nên
+        chỉ so kích thước.
+        """
+        existing = self.get(object_key)
+        if not existing or existing[0] != len(data):
+            return False
+        etag = existing[1]
+        return not etag or "-" in etag or etag == self.content_etag(data)
+
+    def add(self, object_key: str, size: int, etag: Optional[str] = None) -> None:
+        folder = self._folders.setdefault(self._folder_of(object_key), {})
+        folder[object_key] = (size, etag)
+
+    def evict(self, prefix: str) -> None:
+        """Bỏ cache dưới prefix; prefix cha đã list cũng phải list lại"""
+        for folder in [f for f in self._folders if f.startswith(prefix)]:
+            del self._folders[folder]
+        self._listed = {
+            listed
+            for listed in self._listed
+            if not (listed.startswith(prefix) or prefix.startswith(listed))
+        }
+        for key in [k for k in self._locks if k.startswith(prefix)]:
+            del self._locks[key]
+
+    @staticmethod
+    def content_etag(data: bytes) -> str:
+        """ETag R2 trả về cho PUT một phần: MD5 hex của nội dung"""
+        return hashlib.md5(data).hexdigest()
+
+    @staticmethod
+    def _folder_of(object_key: str) -> str:
+        return object_key[: object_key.rfind("/") + 1]
@@ -1,5 +1,8 @@
-from typing import Optional, Tuple
+from io import BytesIO
+from typing import Dict, Optional, Tuple
 import boto3
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
 from botocore.exceptions import ClientError
 from config.r2_config import R2Config
 from shared.logger import logging
@@ -7,16 +10,35 @@ from shared.logger import logging
 
 class R2Storage:
 
-    def __init__(self):
+    # Object lớn hơn ngưỡng được upload multipart, các part chạy song song
+    MULTIPART_THRESHOLD = 8 * 1024 * 1024
+    MULTIPART_CHUNKSIZE = 8 * 1024 * 1024
+    MULTIPART_CONCURRENCY = 4
+    CACHE_CONTROL = "public, max-age=31536000"
+
+    def __init__(self, max_pool_connections: int = 10):
         self.logger = logging.getLogger(__name__)
         R2Config.validate()
 
+        # Pool kết nối phải đủ cho mọi upload đồng thời (kể cả các part của
+        # multipart), nếu không thread upload sẽ phải chờ kết nối rảnh
+        self.max_pool_connections = max_pool_connections
         self.s3_client = boto3.client(
             "s3",
             endpoint_url=R2Config.ENDPOINT_URL,
             aws_access_key_id=R2Config.ACCESS_KEY_ID,
             aws_secret_access_key=R2Config.SECRET_ACCESS_KEY,
             region_name="auto",
+            config=Config(
+                max_pool_connections=max_pool_connections + self.MULTIPART_CONCURRENCY,
+                # Retry do R2Uploader đảm nhận để không giữ thread khi chờ
+                retries={"max_attempts": 1, "mode": "standard"},
+            ),
+        )
+        self.transfer_config = TransferConfig(
+            multipart_threshold=self.MULTIPART_THRESHOLD,
+            multipart_chunksize=self.MULTIPART_CHUNKSIZE,
+            max_concurrency=self.MULTIPART_CONCURRENCY,
         )
         self.bucket_name = R2Config.BUCKET_NAME
         self.public_url = R2Config.PUBLIC_URL
@@ -25,13 +47,7 @@ class R2Storage:
         self, file_data: bytes, object_key: str, content_type: str = "image/webp"
     ) -> Tuple[bool, Optional[str]]:
         try:
-            self.s3_client.put_object(
-                Bucket=self.bucket_name,
-                Key=object_key,
-                Body=file_data,
-                ContentType=content_type,
-                CacheControl="public, max-age=31536000",
-            )
+            self.put_object(file_data, object_key, content_type)
 
             public_url = f"{self.public_url}/{object_key}"
             self.logger.debug(f"✅ Uploaded: {object_key}")
@@ -44,5 +60,36 @@ class R2Storage:
             self.logger.error(f"❌ Unexpected error [{object_key}]: {e}")
             return False, None
 
+    def put_object(
+        self, file_data: bytes, object_key: str, content_type: str = "image/webp"
+    ) -> None:
+        """Upload một object, raise lỗi để caller quyết định retry"""
+        if len(file_data) < self.MULTIPART_THRESHOLD:
+            self.s3_client.put_object(
+                Bucket=self.bucket_name,
+                Key=object_key,
+                Body=file_data,
+                ContentType=content_type,
+                CacheControl=self.CACHE_CONTROL,
+            )
+            return
+
+        self.s3_client.upload_fileobj(
+            BytesIO(file_data),
+            self.bucket_name,
+            object_key,
+            ExtraArgs={"ContentType": content_type, "CacheControl": self.CACHE_CONTROL},
+            Config=self.transfer_config,
+        )
+
+    def list_prefix(self, prefix: str) -> Dict[str, Tuple[int, str]]:
+        """Liệt kê mọi object dưới prefix: key -> (size, etag)"""
+        objects = {}
+        paginator = self.s3_client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.bucket_name, Prefix=prefix):
+            for item in page.get("Contents", []):
+                objects[item["Key"]] = (item["Size"], item["ETag"].strip('"'))
+        return objects
+
     def get_public_url(self, object_key: str) -> str:
         return f"{self.public_url}/{object_key}"
@@ -0,0 +1,103 @@
+import asyncio
+import random
+from typing import Optional
+
+from botocore.exceptions import BotoCoreError, ClientError
+
+from shared.concurrency import ConcurrencyLimiter
+from shared.executors import ExecutorRegistry
+from shared.logger import logging
+from shared.metrics import Metrics
+from shared.r2_manifest import R2Manifest
+from shared.r2_storage import R2Storage
+
+
+class R2Uploader:
+    """Upload async lên R2 qua executor "storage" với số lần thử có jitter.
+
+    Số upload in-flight do limiter quyết định (không vượt quá số thread của
+    executor và số kết nối trong pool của client). Upload chờ slot xếp hàng
+    tối đa QUEUE_DEPTH_PER_SLOT lần số thread; vượt quá thì caller bị chặn
+    lại thay vì dồn thêm dữ liệu vào bộ nhớ. Lỗi tạm thời (5xx, throttle,
+    lỗi kết nối) được thử lại với backoff full jitter, sleep trên event
+    loop nên không giữ thread của executor. Object đã có trong manifest với
+    cùng kích thước và cùng ETag (nếu biết) thì bỏ qua PUT.
+    """
+
+    MAX_RETRIES = 4
+    BACKOFF_BASE = 0.5
+    BACKOFF_MAX = 10.0
+    QUEUE_DEPTH_PER_SLOT = 2
+    RETRY_ERROR_CODES = {
+        "InternalError",
+        "ServiceUnavailable",
+        "SlowDown",
+        "RequestTimeout",
+        "TooManyRequests",
+    }
+
+    def __init__(self, limiter: ConcurrencyLimiter, storage: R2Storage = None):
+        self.logger = logging.getLogger(__name__)
+        self.limiter = limiter
+        workers = ExecutorRegistry.size("storage")
+        self.storage = storage or R2Storage(max_pool_connections=workers)
+        self.manifest = R2Manifest(self.storage)
+        self._queue = asyncio.Semaphore(workers * self.QUEUE_DEPTH_PER_SLOT)
+
+    async def upload(
+        self, file_data: bytes, object_key: str, content_type: str = "image/webp"
+    ) -> Optional[str]:
+        """Upload object, trả về public URL hoặc None nếu thất bại hẳn"""
+        if self.manifest.matches(object_key, file_data):
+            Metrics.inc("r2.manifest.hits")
+            return self.storage.get_public_url(object_key)
+
+        async with self._queue:
+            for attempt in range(self.MAX_RETRIES + 1):
+                try:
+                    async with self.limiter.slot():
+                        await ExecutorRegistry.run(
+                            "storage",
+                            self.storage.put_object,
+                            file_data,
+                            object_key,
+                            content_type,
+                        )
+                    self.manifest.add(
+                        object_key,
+                        len(file_data),
+                        self.manifest.content_etag(file_data),
+                    )
+                    Metrics.inc("r2.uploads")
+                    Metrics.inc("r2.uploaded_bytes", len(file_data))
+                    return self.storage.get_public_url(object_key)
+
+                except (BotoCoreError, ClientError) as e:
+                    if attempt == self.MAX_RETRIES or not self._is_retryable(e):
+                        self.logger.error(f"❌ R2 upload error [{object_key}]: {e}")
+                        Metrics.inc("r2.failures")
+                        return None
+
+                    delay = self._retry_delay(attempt)
+                    Metrics.inc("r2.retries")
+                    self.logger.warning(
+                        f"⚠️ R2 upload lỗi [{object_key}], thử lại sau {delay:.1f}s: {e}"
+                    )
+                    await asyncio.sleep(delay)
+
+                except Exception as e:
+                    self.logger.error(f"❌ Unexpected error [{object_key}]: {e}")
+                    Metrics.inc("r2.failures")
+                    return None
+
+    def _is_retryable(self, error: Exception) -> bool:
+        if not isinstance(error, ClientError):
+            # Lỗi kết nối / timeout của botocore
+            return True
+        code = error.response.get("Error", {}).get("Code", "")
+        status = error.response.get("ResponseMetadata", {}).get("HTTPStatusCode", 0)
+        return code in self.RETRY_ERROR_CODES or status == 429 or status >= 500
+
+    def _retry_delay(self, attempt: int) -> float:
+        # Full jitter: tránh các upload lỗi cùng lúc thử lại cùng lúc
+        return random.uniform(0, min(self.BACKOFF_MAX, self.BACKOFF_BASE * 2**attempt))
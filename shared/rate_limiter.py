@@ -0,0 +1,208 @@
+import asyncio
+import multiprocessing
+import time
+import zlib
+from contextlib import nullcontext
+from typing import Dict, Optional, Set, Tuple
+
+from shared.logger import logging
+
+
+class AdaptiveRateLimiter:
+    """Token bucket cho một host, tự giảm tốc khi bị 429/503.
+
+    Mỗi lần bị throttle, tốc độ giảm một nửa (tối thiểu MIN_RATE_FRACTION
+    của tốc độ cấu hình) và tôn trọng Retry-After; mỗi response thành công
+    tăng lại dần RECOVERY_STEP cho đến tốc độ cấu hình (AIMD).
+    """
+
+    BACKOFF_FACTOR = 0.5
+    RECOVERY_STEP = 0.05
+    MIN_RATE_FRACTION = 0.05
+    THROTTLE_STATUSES = {429, 503}
+
+    def __init__(self, rate_per_minute: float, burst: Optional[float] = None):
+        self.max_rate = rate_per_minute / 60.0
+        self.rate = self.max_rate
+        self.capacity = burst or max(1.0, self.max_rate)
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self.blocked_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(
+            self.capacity, self.tokens + (now - self.updated_at) * self.rate
+        )
+        self.updated_at = now
+
+    def _state_lock(self):
+        """Khóa quanh mỗi lần đọc/ghi trạng thái bucket"""
+        return nullcontext()
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            while True:
+                with self._state_lock():
+                    wait = self._take(time.monotonic())
+                if wait <= 0:
+                    return
+                await asyncio.sleep(wait)
+
+    def _take(self, now: float) -> float:
+        """Lấy một token, trả về số giây phải chờ nếu chưa lấy được"""
+        if now < self.blocked_until:
+            return self.blocked_until - now
+
+        self._refill(now)
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        return (1 - self.tokens) / self.rate
+
+    def on_response(self, status_code: int, retry_after: Optional[str] = None) -> None:
+        with self._state_lock():
+            self._on_response(time.monotonic(), status_code, retry_after)
+
+    def _on_response(
+        self, now: float, status_code: int, retry_after: Optional[str]
+    ) -> None:
+        if status_code in self.THROTTLE_STATUSES:
+            self._refill(now)
+            self.rate = max(
+                self.max_rate * self.MIN_RATE_FRACTION, self.rate * self.BACKOFF_FACTOR
+            )
+            if retry_after and retry_after.isdigit():
+                self.blocked_until = max(self.blocked_until, now + float(retry_after))
+        elif status_code < 400 and self.rate < self.max_rate:
+            self._refill(now)
+            self.rate = min(
+                self.max_rate, self.rate + self.max_rate * self.RECOVERY_STEP
+            )
+
+
+class SharedRateLimitTable:
+    """Bảng token bucket trong shared memory, dùng chung giữa các process.
+
+    Mỗi slot là một dãy double (key, tokens, updated_at, rate,
+    blocked_until); key là crc32 của "source|host", tìm slot bằng dò tuyến
+    tính. time.monotonic() dùng chung một đồng hồ cho mọi process trên
+    cùng máy nên các mốc thời gian so sánh được với nhau. Tạo bảng trong
+    process cha rồi truyền cho process con khi khởi tạo.
+    """
+
+    FIELDS = ("key", "tokens", "updated_at", "rate", "blocked_until")
+    DEFAULT_SLOTS = 256
+
+    def __init__(self, slots: int = DEFAULT_SLOTS, context=None):
+        # Lock phải tạo cùng context với process con (mặc định spawn)
+        context = context or multiprocessing.get_context("spawn")
+        self.slots = slots
+        self.values = context.Array("d", slots * len(self.FIELDS))
+
+    @property
+    def lock(self):
+        return self.values.get_lock()
+
+    def offset(self, slot: int, field: str) -> int:
+        return slot * len(self.FIELDS) + self.FIELDS.index(field)
+
+    def slot_for(self, key: str, capacity: float, rate: float) -> int:
+        """Slot của key, khởi tạo bucket đầy nếu chưa process nào dùng"""
+        key_hash = float(zlib.crc32(key.encode()) or 1)
+        start = int(key_hash) % self.slots
+        with self.lock:
+            for probe in range(self.slots):
+                slot = (start + probe) % self.slots
+                stored = self.values[self.offset(slot, "key")]
+                if stored == key_hash:
+                    return slot
+                if stored == 0:
+                    self.values[self.offset(slot, "key")] = key_hash
+                    self.values[self.offset(slot, "tokens")] = capacity
+                    self.values[self.offset(slot, "updated_at")] = time.monotonic()
+                    self.values[self.offset(slot, "rate")] = rate
+                    return slot
+        raise RuntimeError("Bảng rate limit dùng chung đã đầy")
+
+
+def _shared_field(name: str) -> property:
+    def getter(self) -> float:
+        return self.table.values[self.table.offset(self.slot, name)]
+
+    def setter(self, value: float) -> None:
+        self.table.values[self.table.offset(self.slot, name)] = value
+
+    return property(getter, setter)
+
+
+class SharedAdaptiveRateLimiter(AdaptiveRateLimiter):
+    """AdaptiveRateLimiter có trạng thái nằm trong SharedRateLimitTable.
+
+    Mọi process cùng rút token từ một bucket, nên tổng số request tới host
+    không vượt quá tốc độ cấu hình dù chạy bao nhiêu process; giảm tốc do
+    429/503 ở một process cũng áp dụng cho các process còn lại.
+    """
+
+    tokens = _shared_field("tokens")
+    updated_at = _shared_field("updated_at")
+    rate = _shared_field("rate")
+    blocked_until = _shared_field("blocked_until")
+
+    def __init__(
+        self,
+        table: SharedRateLimitTable,
+        key: str,
+        rate_per_minute: float,
+        burst: Optional[float] = None,
+    ):
+        self.table = table
+        self.max_rate = rate_per_minute / 60.0
+        self.capacity = burst or max(1.0, self.max_rate)
+        self.slot = table.slot_for(key, self.capacity, self.max_rate)
+        self._lock = asyncio.Lock()
+
+    def _state_lock(self):
+        return self.table.lock
+
+
+class RateLimiterRegistry:
+    """Giữ một AdaptiveRateLimiter cho mỗi cặp (source, host).
+
+    Host chính của source dùng rate_limit_per_minute trong DB; các host khác
+    (CDN ảnh) được nhân ASSET_RATE_MULTIPLIER vì chúng chịu tải tốt hơn.
+    Có shared_table thì bucket được chia sẻ với các process khác.
+    """
+
+    DEFAULT_RATE_PER_MINUTE = 30
+    ASSET_RATE_MULTIPLIER = 60
+
+    def __init__(self, shared_table: Optional[SharedRateLimitTable] = None):
+        self.logger = logging.getLogger(__name__)
+        self.shared_table = shared_table
+        self._limiters: Dict[Tuple[str, str], AdaptiveRateLimiter] = {}
+        self._page_hosts: Dict[str, Set[str]] = {}
+        self._rates: Dict[str, int] = {}
+
+    def configure_source(
+        self, source_name: str, rate_per_minute: Optional[int], *page_hosts: str
+    ) -> None:
+        self._rates[source_name] = rate_per_minute or self.DEFAULT_RATE_PER_MINUTE
+        self._page_hosts.setdefault(source_name, set()).update(
+            host for host in page_hosts if host
+        )
+
+    def get(self, source_name: str, host: str) -> AdaptiveRateLimiter:
+        key = (source_name, host)
+        if key not in self._limiters:
+            rate = self._rates.get(source_name, self.DEFAULT_RATE_PER_MINUTE)
+            if host not in self._page_hosts.get(source_name, set()):
+                rate *= self.ASSET_RATE_MULTIPLIER
+            if self.shared_table is not None:
+                self._limiters[key] = SharedAdaptiveRateLimiter(
+                    self.shared_table, f"{source_name}|{host}", rate
+                )
+            else:
+                self._limiters[key] = AdaptiveRateLimiter(rate)
+            self.logger.debug(f"Rate limit {source_name}/{host}: {rate}/phút")
+        return self._limiters[key]
@@ -30,6 +30,18 @@ class StorageUtils:
         chapter_folder.mkdir(parents=True, exist_ok=True)
         return chapter_folder
 
+    @staticmethod
+    def r2_series_prefix(series_title: str) -> str:
+        return f"{StorageUtils.sanitize_filename(series_title)}/"
+
+    @staticmethod
+    def r2_chapter_prefix(series_title: str, chapter_number: float) -> str:
+        # Chapter nguyên lưu trong DB dạng float (12.0) nhưng key dùng "12"
+        if isinstance(chapter_number, float) and chapter_number.is_integer():
+            chapter_number = int(chapter_number)
+        safe_chapter = StorageUtils.sanitize_filename(f"chapter_{chapter_number}")
+        return f"{StorageUtils.r2_series_prefix(series_title)}{safe_chapter}/"
+
     @staticmethod
     def get_relative_path(base_path: Path, full_path: Path) -> str:
         try:
@@ -0,0 +1,289 @@
+import asyncio
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager, nullcontext
+from io import BytesIO
+from multiprocessing.shared_memory import SharedMemory
+from typing import BinaryIO, List, Optional, Tuple, Union
+
+from PIL import Image
+
+from shared.executors import ExecutorRegistry
+from shared.image_utils import ImageConverter
+from shared.logger import logging
+from shared.memory_budget import MemoryBudget
+from shared.metrics import Metrics
+
+ImageInput = Union[bytes, BinaryIO]
+
+
+def _as_bytes(image_data: ImageInput) -> bytes:
+    if isinstance(image_data, (bytes, bytearray)):
+        return image_data
+    image_data.seek(0)
+    return image_data.read()
+
+
+def _as_file(image_data: ImageInput) -> BinaryIO:
+    if isinstance(image_data, (bytes, bytearray)):
+        return BytesIO(image_data)
+    image_data.seek(0)
+    return image_data
+
+
+def _read_shared_memory(shm_name: str, start: int, end: int) -> bytes:
+    # Process con chỉ đọc segment; tiến trình cha giữ quyền unlink
+    shm = SharedMemory(name=shm_name)
+    try:
+        return bytes(shm.buf[start:end])
+    finally:
+        shm.close()
+
+
+def _encode_from_shared_memory(
+    shm_name: str, size: int, quality: int
+) -> Tuple[Optional[bytes], int]:
+    image_data = _read_shared_memory(shm_name, 0, size)
+    return ImageConverter.to_webp(image_data, quality)
+
+
+def _decode_into_shared_memory(source, size: int, raw_shm_name: str) -> Tuple[int, int]:
+    image_data = source if size < 0 else _read_shared_memory(source, 0, size)
+    image = ImageConverter.flatten_to_rgb(Image.open(BytesIO(image_data)))
+
+    raw = SharedMemory(name=raw_shm_name)
+    try:
+        pixels = image.tobytes()
+        raw.buf[: len(pixels)] = pixels
+    finally:
+        raw.close()
+    return image.size
+
+
+def _encode_tile_from_shared_memory(
+    raw_shm_name: str, width: int, top: int, bottom: int, quality: int
+) -> Tuple[Optional[bytes], int]:
+    row_bytes = width * 3
+    pixels = _read_shared_memory(raw_shm_name, top * row_bytes, bottom * row_bytes)
+    tile = Image.frombytes("RGB", (width, bottom - top), pixels)
+    return ImageConverter.encode_webp(tile, quality)
+
+
+class WebPEncoder:
+    """Stage encode WebP chạy trên process pool riêng.
+
+    Encode WebP (method=6) là bước tốn CPU nhất, nên tách khỏi thread pool
+    mặc định để scale theo số core. Ảnh lớn được chuyển sang worker qua
+    shared memory thay vì pickle cả buffer qua pipe. Nếu có memory_budget,
+    mỗi job xin trước bộ nhớ cho bitmap đã decode (rộng x cao x số kênh)
+    cộng ước lượng output (bằng kích thước ảnh nguồn); output thực được giữ
+    ở level ENCODED trước khi trả phần decode, người gọi release khi xong.
+    """
+
+    QUEUE_DEPTH_PER_WORKER = 2
+    SHARED_MEMORY_THRESHOLD = 256 * 1024
+    COPY_CHUNK_SIZE = 1024 * 1024
+
+    def __init__(
+        self,
+        max_workers: Optional[int] = None,
+        memory_budget: Optional[MemoryBudget] = None,
+    ):
+        # Cùng kích thước với executor "cpu" (đổi qua EXECUTOR_CPU_WORKERS)
+        self.max_workers = max_workers or ExecutorRegistry.size("cpu")
+        self.memory_budget = memory_budget
+        self.logger = logging.getLogger(__name__)
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._queued = 0
+        self._busy = 0
+        # Giới hạn số job đang chờ/đang chạy (hàng đợi có giới hạn)
+        self._queue_slots = asyncio.Semaphore(
+            self.max_workers * self.QUEUE_DEPTH_PER_WORKER
+        )
+
+    @property
+    def executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+            self.logger.info(f"🧵 WebP encoder: {self.max_workers} processes")
+        return self._executor
+
+    async def _submit(self, fn, *args):
+        self._queued += 1
+        self._export()
+        async with self._queue_slots:
+            self._queued -= 1
+            self._busy += 1
+            self._export()
+            try:
+                loop = asyncio.get_running_loop()
+                return await loop.run_in_executor(self.executor, fn, *args)
+            finally:
+                self._busy -= 1
+                self._export()
+
+    def _export(self) -> None:
+        # Cùng tên metric với ExecutorRegistry để so sánh độ bão hòa các stage
+        Metrics.set_gauge("executor.encode.max_workers", self.max_workers)
+        Metrics.set_gauge("executor.encode.queue_length", self._queued)
+        Metrics.set_gauge("executor.encode.busy", min(self._busy, self.max_workers))
+
+    def _reserve(self, nbytes: int):
+        if self.memory_budget is None:
+            return nullcontext()
+        return self.memory_budget.reserve(nbytes, MemoryBudget.DECODE)
+
+    async def _hold_output(self, results: List[Tuple[Optional[bytes], int]]) -> None:
+        # Xin ENCODED khi vẫn giữ DECODE: output luôn nằm trong ngân sách
+        if self.memory_budget is not None:
+            await self.memory_budget.acquire(
+                self.output_bytes(results), MemoryBudget.ENCODED
+            )
+
+    @staticmethod
+    def output_bytes(results: List[Tuple[Optional[bytes], int]]) -> int:
+        """Số bytes ENCODED mà encode()/encode_tiles() đã giữ cho results"""
+        return sum(len(webp_data) for webp_data, _ in results if webp_data)
+
+    @staticmethod
+    def _input_size(image_data: ImageInput) -> int:
+        if isinstance(image_data, (bytes, bytearray)):
+            return len(image_data)
+        size = image_data.seek(0, os.SEEK_END)
+        image_data.seek(0)
+        return size
+
+    @staticmethod
+    def _decoded_bytes(image: Image.Image) -> int:
+        width, height = image.size
+        return width * height * len(image.getbands())
+
+    @contextmanager
+    def _shared_input(self, image_data: ImageInput):
+        """Trả về (source, size) để truyền sang worker; size < 0 nghĩa là bytes.
+
+        image_data là bytes hoặc file nhị phân seek được (vd. buffer spool
+        của downloader); file được chép thẳng vào shared memory theo chunk.
+        """
+        size = self._input_size(image_data)
+        if size < self.SHARED_MEMORY_THRESHOLD:
+            yield _as_bytes(image_data), -1
+            return
+
+        shm = SharedMemory(create=True, size=size)
+        try:
+            if isinstance(image_data, (bytes, bytearray)):
+                shm.buf[:size] = image_data
+            else:
+                offset = 0
+                while chunk := image_data.read(self.COPY_CHUNK_SIZE):
+                    shm.buf[offset : offset + len(chunk)] = chunk
+                    offset += len(chunk)
+            yield shm.name, size
+        finally:
+            shm.close()
+            shm.unlink()
+
+    async def encode(
+        self, image_data: ImageInput, quality: int = ImageConverter.DEFAULT_WEBP_QUALITY
+    ) -> Tuple[Optional[bytes], int]:
+        try:
+            decoded_bytes = self._decoded_bytes(Image.open(_as_file(image_data)))
+        except Exception:
+            # Header hỏng: để to_webp báo lỗi như bình thường
+            decoded_bytes = 0
+
+        async with self._reserve(decoded_bytes + self._input_size(image_data)):
+            with self._shared_input(image_data) as (source, size):
+                if size < 0:
+                    result = await self._submit(ImageConverter.to_webp, source, quality)
+                else:
+                    result = await self._submit(
+                        _encode_from_shared_memory, source, size, quality
+                    )
+            await self._hold_output([result])
+            return result
+
+    async def encode_tiles(
+        self,
+        image_data: ImageInput,
+        quality: int = ImageConverter.DEFAULT_WEBP_QUALITY,
+        tile_height: int = ImageConverter.TILE_HEIGHT,
+    ) -> List[Tuple[Optional[bytes], int]]:
+        """Cắt ảnh quá cao thành các đoạn tile_height px và encode song song.
+
+        Ảnh chỉ được decode một lần vào shared memory (RGB thô); mỗi tile
+        là một job riêng nên một strip lớn dùng được tất cả các core.
+        Ảnh không cần cắt được encode như encode() thông thường.
+        """
+        try:
+            header = Image.open(_as_file(image_data))
+            width, height = header.size
+            ImageConverter.check_pixel_limit((width, height))
+        except Exception as e:
+            self.logger.error(f"Error convert WebP: {e}")
+            return [(None, 0)]
+
+        if (
+            height <= ImageConverter.MAX_WEBP_SIZE
+            or width > ImageConverter.MAX_WEBP_SIZE
+        ):
+            return [await self.encode(image_data, quality)]
+
+        # Bitmap decode trong worker + bản RGB thô trong shared memory + output
+        async with self._reserve(
+            self._decoded_bytes(header)
+            + width * height * 3
+            + self._input_size(image_data)
+        ):
+            results = await self._encode_tiles_raw(
+                image_data, width, height, quality, tile_height
+            )
+            await self._hold_output(results)
+            return results
+
+    async def _encode_tiles_raw(
+        self,
+        image_data: ImageInput,
+        width: int,
+        height: int,
+        quality: int,
+        tile_height: int,
+    ) -> List[Tuple[Optional[bytes], int]]:
+        raw = SharedMemory(create=True, size=width * height * 3)
+        try:
+            with self._shared_input(image_data) as (source, size):
+                await self._submit(_decode_into_shared_memory, source, size, raw.name)
+
+            return await asyncio.gather(
+                *[
+                    self._submit(
+                        _encode_tile_from_shared_memory,
+                        raw.name,
+                        width,
+                        top,
+                        bottom,
+                        quality,
+                    )
+                    for top, bottom in ImageConverter.tile_bounds(height, tile_height)
+                ]
+            )
+        except Exception as e:
+            self.logger.error(f"Error encode tiles: {e}")
+            return [(None, 0)]
+        finally:
+            raw.close()
+            raw.unlink()
+
+    async def aclose(self) -> None:
+        """shutdown() chờ các process encode thoát nên chạy ngoài event loop"""
+        await asyncio.to_thread(self.shutdown)
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
@@ -0,0 +1,165 @@
+import argparse
+import asyncio
+import multiprocessing
+import os
+import signal
+import threading
+from datetime import datetime
+from typing import List
+
+from apscheduler.schedulers.asyncio import AsyncIOScheduler
+from apscheduler.triggers.combining import OrTrigger
+from apscheduler.triggers.cron import CronTrigger
+from shared.logger import logging
+from shared.memory_budget import MemoryBudget
+from shared.rate_limiter import SharedRateLimitTable
+
+logger = logging.getLogger(__name__)
+
+WORKER_START_METHOD = "spawn"
+
+# Worker đang chạy của supervisor; signal handler ở main dừng chúng vì
+# run_workers chạy trong thread, không nhận được signal
+_active_workers: List[multiprocessing.Process] = []
+_workers_lock = threading.Lock()
+_stopping = threading.Event()
+
+
+def _worker_main(
+    index: int, count: int, rate_limit_table: SharedRateLimitTable, daemon: bool
+):
+    # Import trong process con: Prisma client, signal handler, process pool
+    # encode... đều được tạo riêng cho từng worker
+    from database.leech_manager import LeecheDatabaseManager
+    from leecher.service import MangaLeechService
+
+    async def run():
+        service = MangaLeechService(
+            db_manager=LeecheDatabaseManager(),
+            shard=(index, count),
+            rate_limit_table=rate_limit_table,
+        )
+        if daemon:
+            await service.run_daemon()
+        else:
+            await service.start()
+
+    logger.info(f"👷 Worker {index}/{count} (pid {os.getpid()}) bắt đầu")
+    asyncio.run(run())
+
+
+def _share_resources(count: int) -> None:
+    """Chia CPU và ngân sách bộ nhớ của máy cho các worker qua biến môi trường"""
+    cpu_per_worker = max(1, (os.cpu_count() or 1) // count)
+    os.environ.setdefault("EXECUTOR_CPU_WORKERS", str(cpu_per_worker))
+    budget_mb = MemoryBudget.default_limit() // count // (1024 * 1024)
+    os.environ["MEMORY_BUDGET_MB"] = str(max(64, budget_mb))
+
+
+def run_workers(
+    count: int, rate_limit_table: SharedRateLimitTable, daemon: bool = False
+) -> None:
+    """Chạy count worker, mỗi worker xử lý một shard series, chờ tất cả xong"""
+    context = multiprocessing.get_context(WORKER_START_METHOD)
+    workers: List[multiprocessing.Process] = [
+        context.Process(
+            target=_worker_main,
+            args=(index, count, rate_limit_table, daemon),
+            name=f"leecher-{index}",
+        )
+        for index in range(count)
+    ]
+    with _workers_lock:
+        if _stopping.is_set():
+            return
+        for worker in workers:
+            worker.start()
+        _active_workers.extend(workers)
+
+    try:
+        for worker in workers:
+            worker.join()
+    finally:
+        # Supervisor bị dừng: báo worker dừng để trả lease đang giữ
+        for worker in workers:
+            if worker.is_alive():
+                worker.terminate()
+        for worker in workers:
+            worker.join()
+        with _workers_lock:
+            for worker in workers:
+                _active_workers.remove(worker)
+
+    failed = [w.name for w in workers if w.exitcode not in (0, -signal.SIGTERM)]
+    if failed:
+        logger.error(f"❌ Worker lỗi: {', '.join(failed)}")
+
+
+def stop_workers() -> None:
+    """Báo mọi worker đang chạy dừng (SIGTERM) và không khởi động lượt mới"""
+    with _workers_lock:
+        _stopping.set()
+        for worker in _active_workers:
+            if worker.is_alive():
+                worker.terminate()
+
+
+async def run_supervised_service(
+    count: int, rate_limit_table: SharedRateLimitTable, daemon: bool = False
+):
+    logger.info(f"🚀 Bắt đầu chạy {count} workers: {datetime.now()}")
+    await asyncio.to_thread(run_workers, count, rate_limit_table, daemon)
+    logger.info(f"✅ Kết thúc {count} workers: {datetime.now()}")
+
+
+async def main(count: int, once: bool, daemon: bool):
+    _share_resources(count)
+    # Rate limit theo source/host dùng chung cho mọi worker và mọi lượt chạy
+    rate_limit_table = SharedRateLimitTable(
+        context=multiprocessing.get_context(WORKER_START_METHOD)
+    )
+
+    stop = asyncio.Event()
+
+    def on_signal(signum: int) -> None:
+        logger.info(f"🛑 Nhận {signal.Signals(signum).name}, dừng các worker...")
+        stop_workers()
+        stop.set()
+
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, on_signal, signum)
+
+    if once or daemon:
+        # Worker bị terminate thì run_workers tự join xong và trả về
+        await run_supervised_service(count, rate_limit_table, daemon)
+        return
+
+    scheduler = AsyncIOScheduler()
+    # max_instances=1: lượt sau không chạy chồng lên lượt trước chưa xong
+    scheduler.add_job(
+        run_supervised_service,
+        OrTrigger([CronTrigger(hour=0, minute=0), CronTrigger(hour=20, minute=15)]),
+        args=(count, rate_limit_table),
+        max_instances=1,
+        coalesce=True,
+    )
+    scheduler.start()
+
+    try:
+        await stop.wait()
+    finally:
+        scheduler.shutdown(wait=False)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Chạy nhiều leecher worker")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--once", action="store_true", help="Chạy một lượt rồi thoát")
+    parser.add_argument(
+        "--daemon",
+        action="store_true",
+        help="Chạy liên tục, kiểm tra từng series khi tới hạn",
+    )
+    args = parser.parse_args()
+    asyncio.run(main(max(1, args.workers), args.once, args.daemon))
@@ -0,0 +1,71 @@
+import random
+from datetime import datetime, timedelta, timezone
+
+from leecher.check_schedule import CheckPolicy, CheckSchedule
+from shared.logger import logging
+
+logger = logging.getLogger(__name__)
+
+
+def releases(now: datetime, every: timedelta, count: int = 8):
+    """Lịch sử ra chapter đều đặn, mỗi lần 2 chapter cách nhau vài phút"""
+    times = []
+    for i in range(count):
+        released_at = now - i * every - timedelta(hours=2)
+        times += [released_at, released_at - timedelta(minutes=5)]
+    return times
+
+
+def test_policy():
+    print("🧪 Testing nhịp kiểm tra theo lịch ra chapter...")
+    now = datetime.now(timezone.utc)
+    cases = {
+        "hằng ngày": CheckPolicy.interval(
+            "ACTIVE", releases(now, timedelta(days=1)), now
+        ),
+        "hằng tuần": CheckPolicy.interval(
+            "ACTIVE", releases(now, timedelta(weeks=1)), now
+        ),
+        "ngừng ra": CheckPolicy.interval(
+            "ACTIVE", releases(now - timedelta(days=90), timedelta(days=1)), now
+        ),
+        "hoàn thành": CheckPolicy.interval("COMPLETED", [], now),
+        "chưa có lịch sử": CheckPolicy.interval("ACTIVE", [], now),
+    }
+    for name, interval in cases.items():
+        print(f"   {name}: {interval}")
+
+    assert cases["hằng ngày"] == timedelta(hours=6)
+    assert cases["hằng tuần"] == timedelta(hours=42)
+    assert cases["ngừng ra"] == CheckPolicy.DORMANT_INTERVAL
+    assert cases["hoàn thành"] == CheckPolicy.COMPLETED_INTERVAL
+    assert cases["chưa có lịch sử"] == CheckPolicy.DEFAULT_INTERVAL
+
+    # Jitter giữ trong ±JITTER để các series không dồn vào cùng lúc
+    due = CheckPolicy.next_check_at("ACTIVE", [], now, random.Random(1))
+    assert abs(due - now - CheckPolicy.DEFAULT_INTERVAL) <= (
+        CheckPolicy.DEFAULT_INTERVAL * CheckPolicy.JITTER
+    )
+    print("✅ Nhịp kiểm tra đúng")
+
+
+def test_schedule():
+    print("🧪 Testing heap lịch kiểm tra...")
+    now = datetime.now(timezone.utc)
+    schedule = CheckSchedule()
+    schedule.rebuild([(1, now - timedelta(minutes=1)), (2, now + timedelta(hours=1))])
+    schedule.push(3, now - timedelta(minutes=5))
+    # Dời hạn series 1 về sau: mục cũ trong heap bị bỏ qua
+    schedule.push(1, now + timedelta(hours=2))
+
+    assert schedule.pop_due(now) == {3}
+    assert schedule.next_due() == now + timedelta(hours=1)
+    assert schedule.pop_due(now + timedelta(hours=3)) == {1, 2}
+    assert schedule.next_due() is None
+    print("✅ Heap lịch kiểm tra đúng")
+
+
+if __name__ == "__main__":
+    test_policy()
+    test_schedule()
+    print("🎉 Check schedule test completed!")
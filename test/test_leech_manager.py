@@ -70,6 +70,19 @@ async def test_leech_manager():
         pending_series = await db.get_pending_series()
         print(f"✅ Số pending series: {len(pending_series)}")
 
+        # 7. Claim series qua lease: node thứ hai không claim trùng
+        print("7. Claim series qua lease...")
+        claimed = await db.claim_series("test-node-a", lease_seconds=60)
+        if claimed:
+            other = await db.claim_series("test-node-b", lease_seconds=60)
+            assert claimed[0].id not in {s.id for s in other}
+            renewed = await db.renew_series_leases(
+                [claimed[0].id], "test-node-a", lease_seconds=60
+            )
+            print(f"   ✅ Claim {claimed[0].title}, gia hạn {renewed} lease")
+            for series in claimed + other:
+                await db.release_series_lease(series.id, series.lease_owner)
+
         print("🎉 Tất cả tests passed!")
 
     except Exception as e:
@@ -36,6 +36,7 @@ async def test_leecher():
     except Exception as e:
         logging.error(f"❌ Lỗi test: {e}")
     finally:
+        await leecher.close()
         await db.disconnect()
 
 
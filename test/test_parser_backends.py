@@ -0,0 +1,138 @@
+import json
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+from leecher.html_backend import HTML_BACKENDS
+from leecher.parsers.truyenqq_parser import TruyenQQParser
+from shared.logger import logging
+
+FIXTURES = Path(__file__).parent / "fixtures"
+
+
+def load_fixture(name: str):
+    html = (FIXTURES / f"{name}.html").read_bytes()
+    expected = json.loads((FIXTURES / f"{name}.expected.json").read_text("utf-8"))
+    return TruyenQQParser.decode_html(html), expected
+
+
+def test_backend(backend: str, rounds: int = 20) -> bool:
+    """So kết quả của backend với output đã ghi lại từ parser cũ"""
+    parser = TruyenQQParser()
+    parser.html = HTML_BACKENDS[backend]()
+    series_html, series_expected = load_fixture("truyenqq_series")
+    chapter_html, chapter_expected = load_fixture("truyenqq_chapter")
+
+    started_at = time.perf_counter()
+    for _ in range(rounds):
+        chapters = parser.parse_chapter_list(series_html, series_expected["series_url"])
+        image_urls = parser.parse_image_urls(
+            chapter_html, chapter_expected["chapter_url"]
+        )
+    elapsed = (time.perf_counter() - started_at) / rounds * 1000
+
+    chapters_ok = chapters == series_expected["chapters"]
+    images_ok = image_urls == chapter_expected["image_urls"]
+    print(
+        f"   {backend}: chapters {'✅' if chapters_ok else '❌'}, "
+        f"images {'✅' if images_ok else '❌'}, {elapsed:.2f} ms/lượt"
+    )
+    return chapters_ok and images_ok
+
+
+def test_known_urls_early_exit() -> bool:
+    """Chỉ xử lý chapter mới cùng chuỗi chapter đã biết ngay sau chúng"""
+    parser = TruyenQQParser()
+    series_html, series_expected = load_fixture("truyenqq_series")
+    all_chapters = series_expected["chapters"]
+    known_urls = {ch["url"] for ch in all_chapters[:-2]}
+
+    chapters = parser.parse_chapter_list(
+        series_html, series_expected["series_url"], known_urls
+    )
+    expected = all_chapters[-(2 + parser.KNOWN_CHAPTER_RUN) :]
+    ok = chapters == expected
+    print(
+        f"   dừng sớm: {len(chapters)}/{len(all_chapters)} chapters {'✅' if ok else '❌'}"
+    )
+    return ok
+
+
+def test_chapter_list_fingerprint() -> bool:
+    """Hash không đổi khi chỉ cột thời gian đổi, đổi khi có chapter mới"""
+    parser = TruyenQQParser()
+    series_html, _ = load_fixture("truyenqq_series")
+    fingerprint = parser.chapter_list_fingerprint(series_html)
+
+    retimed = series_html.replace("09/04/2024", "1 giờ trước")
+    added = series_html.replace(
+        '<div class="works-chapter-list">',
+        '<div class="works-chapter-list"><div class="works-chapter-item row">'
+        '<div class="name-chap"><a href="/chap-121.html">Chương 121</a></div></div>',
+    )
+    ok = (
+        fingerprint is not None
+        and parser.chapter_list_fingerprint(retimed) == fingerprint
+        and parser.chapter_list_fingerprint(added) != fingerprint
+    )
+    print(f"   fingerprint danh sách chapter {'✅' if ok else '❌'}")
+    return ok
+
+
+def test_recent_updates(backend: str) -> bool:
+    """Đọc trang mới cập nhật: URL tuyệt đối và thời gian cập nhật"""
+    parser = TruyenQQParser()
+    parser.html = HTML_BACKENDS[backend]()
+    html = (FIXTURES / "truyenqq_recent.html").read_text("utf-8")
+    page_url = "https://truyenqq.com/truyen-moi-cap-nhat/trang-1.html"
+    now = datetime.now(timezone.utc)
+
+    updates = parser.parse_recent_updates(html, page_url)
+    urls = [item["url"] for item in updates]
+    times = [item["updated_at"] for item in updates]
+    ok = (
+        urls
+        == [
+            "https://truyenqq.com/truyen-tranh/lao-xa-tu-tien-truyen-16211",
+            "https://truyenqq.com/truyen-tranh/vo-luyen-dinh-phong-1234",
+            "https://truyenqq.com/truyen-tranh/dao-hai-tac-77",
+            "https://truyenqq.com/truyen-tranh/khong-ro-thoi-gian-5",
+        ]
+        and abs(now - timedelta(minutes=15) - times[0]) < timedelta(minutes=1)
+        and abs(now - timedelta(hours=3) - times[1]) < timedelta(minutes=1)
+        and times[2] == datetime(2024, 2, 2, 1, 30, tzinfo=timezone.utc)
+        and times[3] is None
+    )
+
+    # Dừng ở mục đầu tiên cũ hơn since
+    collected = []
+    reached = parser._collect_recent_updates(
+        updates, now - timedelta(days=1), collected
+    )
+    ok = ok and reached and len(collected) == 2
+    print(f"   {backend}: trang mới cập nhật {'✅' if ok else '❌'}")
+    return ok
+
+
+def test_decode_html():
+    assert TruyenQQParser.decode_html("Chương".encode("utf-8")) == "Chương"
+    assert (
+        TruyenQQParser.decode_html(
+            "Chương".encode("cp1258"), "text/html; charset=cp1258"
+        )
+        == "Chương"
+    )
+    meta = '<meta charset="windows-1252"><p>café</p>'.encode("windows-1252")
+    assert TruyenQQParser.decode_html(meta).endswith("café</p>")
+    return True
+
+
+if __name__ == "__main__":
+    logging.getLogger("TruyenQQParser").setLevel(logging.WARNING)
+    print("🧪 So sánh HTML backend trên fixtures...")
+    results = [test_backend(name) for name in HTML_BACKENDS]
+    results.extend(test_recent_updates(name) for name in HTML_BACKENDS)
+    results.append(test_known_urls_early_exit())
+    results.append(test_chapter_list_fingerprint())
+    results.append(test_decode_html())
+    print("🎉 Khớp toàn bộ!" if all(results) else "⚠️ Có backend không khớp")
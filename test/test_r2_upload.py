@@ -3,7 +3,9 @@ from io import BytesIO
 from shared.logger import logging
 from PIL import Image
 
+from shared.concurrency import AdaptiveConcurrencyLimiter
 from shared.r2_storage import R2Storage
+from shared.r2_uploader import R2Uploader
 
 logger = logging.getLogger(__name__)
 
@@ -78,6 +80,42 @@ async def test_file_operations():
         return False
 
 
+async def test_async_uploader():
+    """Chạy được với MinIO local: đặt R2_ENDPOINT_URL=http://localhost:9000"""
+    logger.info("\n=== TEST 4: Async uploader + multipart ===")
+
+    try:
+        uploader = R2Uploader(AdaptiveConcurrencyLimiter("r2", 8))
+
+        keys = [f"test/async_{i:02d}.webp" for i in range(20)]
+        urls = await asyncio.gather(
+            *(
+                uploader.upload(create_test_image(key), key, "image/webp")
+                for key in keys
+            )
+        )
+        if not all(urls):
+            logger.error("❌ Async upload failed")
+            return False
+        logger.info(f"✅ Uploaded {len(urls)} files song song")
+
+        # Lớn hơn ngưỡng multipart
+        large_data = b"\0" * (R2Storage.MULTIPART_THRESHOLD + 1024 * 1024)
+        large_url = await uploader.upload(
+            large_data, "test/multipart_test.bin", "application/octet-stream"
+        )
+        if not large_url:
+            logger.error("❌ Multipart upload failed")
+            return False
+        logger.info(f"✅ Multipart: {large_url}")
+
+        return True
+
+    except Exception as e:
+        logger.error(f"❌ Error: {e}")
+        return False
+
+
 async def main():
     logger.info("🚀 Bắt đầu test R2 Upload\n")
 
@@ -86,13 +124,16 @@ async def main():
 
         test2 = await test_file_operations()
 
+        test3 = await test_async_uploader()
+
         logger.info("\n" + "=" * 50)
         logger.info("📊 KẾT QUẢ TỔNG HỢP")
         logger.info("=" * 50)
         logger.info(f"Test 1 - Single Upload:    {'✅ PASS' if test1 else '❌ FAIL'}")
         logger.info(f"Test 2 - Multiple Upload:  {'✅ PASS' if test2 else '❌ FAIL'}")
+        logger.info(f"Test 3 - Async Uploader:   {'✅ PASS' if test3 else '❌ FAIL'}")
 
-        all_pass = all([test1, test2])
+        all_pass = all([test1, test2, test3])
         logger.info("=" * 50)
         logger.info(f"{'🎉 TẤT CẢ TESTS PASS!' if all_pass else '⚠️  CÓ TESTS FAILED'}")
 
@@ -0,0 +1,43 @@
+import asyncio
+from io import BytesIO
+from PIL import Image
+
+from shared.image_utils import ImageConverter
+from shared.logger import logging
+from shared.webp_encoder import WebPEncoder
+
+logger = logging.getLogger(__name__)
+
+
+def create_test_strip(size: tuple = (800, 20000)) -> bytes:
+    """Tạo strip webtoon cao hơn giới hạn WebP"""
+    img = Image.new("RGB", size, color="#3498db")
+    buffer = BytesIO()
+    img.save(buffer, format="JPEG", quality=90)
+    return buffer.getvalue()
+
+
+async def test_encode_tiles():
+    encoder = WebPEncoder()
+
+    try:
+        print("🧪 Testing WebP tiling...")
+
+        image_data = create_test_strip()
+        tiles = await encoder.encode_tiles(image_data)
+
+        heights = [Image.open(BytesIO(data)).height for data, _ in tiles]
+        print(f"✅ {len(tiles)} tiles: {heights}")
+        assert sum(heights) == 20000
+        assert max(heights) <= ImageConverter.MAX_WEBP_SIZE
+
+        single = await encoder.encode(create_test_strip((800, 1200)))
+        print(f"✅ Ảnh thường: {single[1]} bytes")
+
+        print("🎉 WebP encoder test completed!")
+    finally:
+        encoder.shutdown()
+
+
+if __name__ == "__main__":
+    asyncio.run(test_encode_tiles())